@@ -0,0 +1,96 @@
+import numpy as np
+import pandas as pd
+from models.meter_store import meter_order
+
+DEFAULT_WINDOW = 168
+DEFAULT_MIN_PERIODS = 24
+Z_THRESHOLD = 3.0
+IQR_FACTOR = 1.5
+MAD_THRESHOLD = 3.5
+
+# Scales the MAD to a standard deviation for normally distributed data
+MAD_SCALE = 1.4826
+# Readings whose windows are sorted at once when computing the rolling MAD
+MAD_BLOCK_ROWS = 8192
+
+
+def _padded_series(values, group_starts, window):
+    """Place each meter's values after `window` NaNs so shifted rolling windows never cross meters
+
+    Returns the padded series and the positions of the original values in it.
+    """
+    n = len(values)
+    group_index = np.searchsorted(group_starts, np.arange(n), side='right') - 1
+    positions = np.arange(n) + (group_index + 1) * window
+    padded = np.full(n + len(group_starts) * window, np.nan)
+    padded[positions] = values
+    return pd.Series(padded), positions
+
+
+def _rolling_mad(padded, positions, median, window):
+    """Median absolute deviation of the `window` values before each position from their own median
+
+    `median` holds the rolling median of those same windows, NaN where a window
+    is too short to score; the MAD is NaN there too.
+    """
+    windows = np.lib.stride_tricks.sliding_window_view(np.asarray(padded), window)
+    mad = np.empty(len(positions))
+    for start in range(0, len(positions), MAD_BLOCK_ROWS):
+        block = slice(start, start + MAD_BLOCK_ROWS)
+        # The window ending just before position p starts at p - window; NaNs sort last
+        deviation = np.sort(np.abs(windows[positions[block] - window] - median[block, None]), axis=1)
+        count = (~np.isnan(deviation)).sum(axis=1)
+        low = np.take_along_axis(deviation, ((count - 1) // 2)[:, None], axis=1)[:, 0]
+        high = np.take_along_axis(deviation, (count // 2)[:, None], axis=1)[:, 0]
+        mad[block] = np.where(count > 0, (low + high) / 2, np.nan)
+    return mad
+
+
+def detect_anomalies_vectorized(df, window=DEFAULT_WINDOW, min_periods=DEFAULT_MIN_PERIODS,
+                                z_threshold=Z_THRESHOLD, iqr_factor=IQR_FACTOR,
+                                mad_threshold=MAD_THRESHOLD, column='t_kWh'):
+    """Rolling per-meter z-score, IQR and MAD anomaly scores in one grouped pass
+
+    Each reading is scored against the `window` readings of the same meter that
+    precede it. Returns a columnar frame with one row per reading.
+    """
+    timestamps = df.index.values
+    meters = df['meter'] if 'meter' in df.columns else np.zeros(len(df), dtype=int)
+    order, group_starts = meter_order(df)
+    values = df[column].to_numpy(dtype='float64')[order]
+
+    padded, positions = _padded_series(values, group_starts, window)
+    # Shift by one so the baseline excludes the reading being scored
+    history = padded.shift(1).rolling(window, min_periods=min_periods)
+    mean = history.mean().to_numpy()[positions]
+    std = history.std().to_numpy()[positions]
+    q1 = history.quantile(0.25).to_numpy()[positions]
+    median = history.median().to_numpy()[positions]
+    q3 = history.quantile(0.75).to_numpy()[positions]
+
+    mad = _rolling_mad(padded, positions, median, window)
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        z_score = (values - mean) / std
+        iqr = q3 - q1
+        iqr_score = np.where(values > q3, (values - q3) / iqr, np.where(values < q1, (q1 - values) / iqr, 0.0))
+        mad_score = (values - median) / (MAD_SCALE * mad)
+
+    z_flag = np.abs(z_score) > z_threshold
+    iqr_flag = iqr_score > iqr_factor
+    mad_flag = np.abs(mad_score) > mad_threshold
+
+    result = pd.DataFrame({
+        'timestamp': timestamps[order],
+        'meter': np.asarray(meters)[order],
+        'consumption': values,
+        'z_score': z_score,
+        'iqr_score': iqr_score,
+        'mad_score': mad_score,
+        'z_anomaly': z_flag,
+        'iqr_anomaly': iqr_flag,
+        'mad_anomaly': mad_flag,
+        # A reading is anomalous when at least two of the three methods agree
+        'is_anomaly': (z_flag.astype(int) + iqr_flag + mad_flag) >= 2
+    })
+    return result
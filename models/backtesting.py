@@ -0,0 +1,107 @@
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import pandas as pd
+from sklearn.ensemble import RandomForestRegressor
+
+from models.forecasting import HISTORY_HOURS, build_history, recursive_forecast
+
+DEFAULT_FOLDS = 3
+DEFAULT_HORIZON = 24
+MIN_TRAIN_ROWS = 100
+
+
+def fold_origins(n_rows, folds, horizon, window=None):
+    """Positions on a meter's hourly grid where each fold's forecast starts, oldest first
+
+    Folds are spaced one horizon apart and end at the last hour. Origins
+    without enough history before them are dropped.
+    """
+    origins = [n_rows - horizon * (folds - i) for i in range(folds)]
+    needed = max(HISTORY_HOURS, MIN_TRAIN_ROWS if window is None else window)
+    return [origin for origin in origins if origin >= needed]
+
+
+def _run_fold(meter, frame, origin, horizon, feature_cols, params, window):
+    """Worker: fit on the hours before the origin and forecast the next `horizon` hours"""
+    train = frame.iloc[:origin] if window is None else frame.iloc[origin - window:origin]
+    complete = train[feature_cols].notna().all(axis=1) & train['t_kWh'].notna()
+    train = train[complete]
+
+    began = time.perf_counter()
+    model = RandomForestRegressor(**params, n_jobs=1)
+    model.fit(train[feature_cols].to_numpy(dtype='float32'), train['t_kWh'].to_numpy())
+    fit_seconds = time.perf_counter() - began
+
+    began = time.perf_counter()
+    history = build_history(frame.iloc[:origin].assign(meter=meter).reset_index())
+    predictions = recursive_forecast(model, history, horizon, feature_cols,
+                                     predict=lambda X: model.predict(X.to_numpy(dtype='float32')))[0]
+    predict_seconds = time.perf_counter() - began
+
+    # Score against the hourly sums; missing hours after the origin show up as missing actuals
+    steps = pd.DatetimeIndex(history['last_timestamp'][0] + np.arange(1, horizon + 1) * np.timedelta64(1, 'h'))
+    actual = frame['t_kWh'].reindex(steps).to_numpy(dtype='float64')
+    return {
+        'meter': meter,
+        'origin': steps[0],
+        'train_rows': len(train),
+        'fit_seconds': fit_seconds,
+        'predict_seconds': predict_seconds,
+        'errors': predictions - actual,
+        'actual': actual
+    }
+
+
+def backtest(chunks, feature_cols, params, folds=DEFAULT_FOLDS, horizon=DEFAULT_HORIZON,
+             window=None, workers=None):
+    """Rolling-origin backtest of the recursive forecaster, per meter, across worker processes
+
+    `chunks` are hourly feature frames; each meter is laid on a complete hourly
+    grid first, so origins, `window` and `horizon` all count hours. Every meter
+    gets `folds` forecast origins one horizon apart. Each fold fits a forest on
+    the meter's hours before the origin (all of them, or the last `window` for a
+    rolling window) and forecasts `horizon` hours ahead. Returns per-horizon
+    MAE/MAPE against the hourly kWh sums and per-fold timings.
+    """
+    workers = workers or os.cpu_count() or 1
+    results = []
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = []
+        for chunk in chunks:
+            for meter, frame in chunk.groupby(chunk['meter'].astype(str), sort=False):
+                frame = frame[['t_kWh'] + feature_cols].asfreq('h')
+                for origin in fold_origins(len(frame), folds, horizon, window):
+                    # Each fold only needs the rows up to the end of its horizon
+                    futures.append(pool.submit(_run_fold, meter, frame.iloc[:origin + horizon], origin,
+                                               horizon, feature_cols, params, window))
+        for future in futures:
+            results.append(future.result())
+
+    if not results:
+        return {'horizon': pd.DataFrame(columns=['horizon', 'mae', 'mape', 'count']),
+                'folds': pd.DataFrame(columns=['meter', 'fold', 'origin', 'train_rows',
+                                               'fit_seconds', 'predict_seconds', 'mae'])}
+
+    errors = np.vstack([result['errors'] for result in results])
+    actual = np.vstack([result['actual'] for result in results])
+    with np.errstate(divide='ignore', invalid='ignore'):
+        percent = np.where(actual != 0, np.abs(errors) / np.abs(actual), np.nan) * 100
+    horizon_report = pd.DataFrame({
+        'horizon': np.arange(1, horizon + 1),
+        'mae': np.nanmean(np.abs(errors), axis=0),
+        'mape': np.nanmean(percent, axis=0),
+        'count': (~np.isnan(errors)).sum(axis=0)
+    })
+
+    folds_report = pd.DataFrame([{
+        'meter': result['meter'],
+        'origin': result['origin'],
+        'train_rows': result['train_rows'],
+        'fit_seconds': result['fit_seconds'],
+        'predict_seconds': result['predict_seconds'],
+        'mae': np.nanmean(np.abs(result['errors']))
+    } for result in results])
+    folds_report.insert(1, 'fold', folds_report.groupby('meter').cumcount())
+    return {'horizon': horizon_report, 'folds': folds_report}
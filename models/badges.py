@@ -0,0 +1,10 @@
+import numpy as np
+
+# Exclusive upper bounds in kWh/day of Eco Saver, Green User and Carbon Heavy;
+# anything above the last one is Efficient Hero
+BADGE_THRESHOLDS = np.array([2.0, 5.0, 8.0])
+
+
+def classify_consumption(daily_consumption):
+    """Badge type (0-3) for every daily consumption value, as one array operation"""
+    return np.searchsorted(BADGE_THRESHOLDS, np.asarray(daily_consumption, dtype='float64'), side='right')
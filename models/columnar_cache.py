@@ -0,0 +1,174 @@
+import os
+import json
+import shutil
+import hashlib
+from urllib.parse import quote
+import pandas as pd
+
+from models.data_processor import CSV_DTYPES, TIMESTAMP_FORMAT
+
+try:
+    import pyarrow  # noqa: F401
+    PYARROW_AVAILABLE = True
+except ImportError:
+    PYARROW_AVAILABLE = False
+
+DEFAULT_CACHE_DIR = 'data/cache'
+MANIFEST_FILE = 'manifest.json'
+CACHE_FORMAT_VERSION = 1
+
+
+def read_manifest(root):
+    """Manifest of an on-disk store, or None if it is missing or unreadable"""
+    try:
+        with open(os.path.join(root, MANIFEST_FILE)) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def write_manifest(root, manifest):
+    """Atomically replace a store's manifest"""
+    tmp_path = os.path.join(root, MANIFEST_FILE + '.tmp')
+    with open(tmp_path, 'w') as f:
+        json.dump(manifest, f)
+    os.replace(tmp_path, os.path.join(root, MANIFEST_FILE))
+
+
+class ColumnarCache:
+    """Parquet copy of a meter CSV, partitioned by meter and month"""
+
+    def __init__(self, source_path, cache_dir=DEFAULT_CACHE_DIR):
+        self.source_path = source_path
+        name = os.path.splitext(os.path.basename(source_path))[0]
+        self.root = os.path.join(cache_dir, name)
+        self.manifest = read_manifest(self.root)
+
+    def _source_hash(self):
+        digest = hashlib.sha256()
+        with open(self.source_path, 'rb') as f:
+            for block in iter(lambda: f.read(8 * 1024 * 1024), b''):
+                digest.update(block)
+        return digest.hexdigest()
+
+    def is_valid(self):
+        """Check the manifest against the source size, mtime and (if needed) hash"""
+        if not PYARROW_AVAILABLE or self.manifest is None:
+            return False
+        if self.manifest.get('format_version') != CACHE_FORMAT_VERSION:
+            return False
+        try:
+            stat = os.stat(self.source_path)
+        except OSError:
+            return False
+        if stat.st_size != self.manifest['size']:
+            return False
+        if stat.st_mtime == self.manifest['mtime']:
+            return True
+        # Touched but maybe not changed: fall back to the content hash
+        if self._source_hash() != self.manifest['sha256']:
+            return False
+        self.manifest['mtime'] = stat.st_mtime
+        write_manifest(self.root, self.manifest)
+        return True
+
+    def build(self, chunk_rows=500000):
+        """Convert the source CSV into partitioned Parquet files, one chunk at a time"""
+        if not PYARROW_AVAILABLE:
+            raise ImportError("pyarrow is required for the columnar cache")
+
+        print(f"Building columnar cache for {self.source_path}...")
+        stat = os.stat(self.source_path)
+        build_root = self.root + '.building'
+        shutil.rmtree(build_root, ignore_errors=True)
+        os.makedirs(build_root)
+
+        partitions = {}
+        rows = 0
+        columns = None
+        for part_no, chunk in enumerate(pd.read_csv(self.source_path, dtype=CSV_DTYPES,
+                                                    chunksize=chunk_rows)):
+            chunk['x_Timestamp'] = pd.to_datetime(chunk['x_Timestamp'], format=TIMESTAMP_FORMAT)
+            months = chunk['x_Timestamp'].dt.strftime('%Y-%m')
+            columns = [col for col in chunk.columns if col != 'meter']
+            for (meter, month), part in chunk.groupby([chunk['meter'], months], observed=True):
+                meter = str(meter)
+                part_dir = os.path.join(build_root, 'meter=' + quote(meter, safe=''), 'month=' + month)
+                os.makedirs(part_dir, exist_ok=True)
+                part[columns].to_parquet(os.path.join(part_dir, f'part-{part_no:05d}.parquet'),
+                                         index=False)
+                months_seen = partitions.setdefault(meter, [])
+                if month not in months_seen:
+                    months_seen.append(month)
+            rows += len(chunk)
+
+        manifest = {
+            'format_version': CACHE_FORMAT_VERSION,
+            'source': self.source_path,
+            'size': stat.st_size,
+            'mtime': stat.st_mtime,
+            'sha256': self._source_hash(),
+            'rows': rows,
+            'columns': columns,
+            'partitions': {meter: sorted(months) for meter, months in partitions.items()}
+        }
+        write_manifest(build_root, manifest)
+
+        # Swap the finished build in so readers never see a half-written cache
+        shutil.rmtree(self.root, ignore_errors=True)
+        os.replace(build_root, self.root)
+        self.manifest = manifest
+        print(f"Columnar cache built: {rows} rows in {sum(len(m) for m in partitions.values())} partitions")
+
+    def ensure(self, chunk_rows=500000):
+        """Rebuild the cache if the source changed since it was written"""
+        if not self.is_valid():
+            self.build(chunk_rows)
+
+    def meters(self):
+        return sorted(self.manifest['partitions']) if self.manifest else []
+
+    def partition_paths(self, meters=None, start=None, end=None):
+        """Directories of the partitions overlapping the requested meters and time range"""
+        if self.manifest is None:
+            return []
+        start_month = pd.Timestamp(start).strftime('%Y-%m') if start is not None else None
+        end_month = pd.Timestamp(end).strftime('%Y-%m') if end is not None else None
+        wanted = set(str(m) for m in meters) if meters is not None else None
+
+        paths = []
+        for meter, months in self.manifest['partitions'].items():
+            if wanted is not None and meter not in wanted:
+                continue
+            for month in months:
+                if start_month and month < start_month:
+                    continue
+                if end_month and month > end_month:
+                    continue
+                paths.append((meter, os.path.join(self.root, 'meter=' + quote(meter, safe=''),
+                                                  'month=' + month)))
+        return paths
+
+    def load(self, meters=None, start=None, end=None):
+        """Read only the partitions needed for the given meters and time range"""
+        frames = []
+        for meter, path in self.partition_paths(meters, start, end):
+            for name in sorted(os.listdir(path)):
+                part = pd.read_parquet(os.path.join(path, name))
+                part['meter'] = meter
+                frames.append(part)
+
+        if not frames:
+            columns = ['x_Timestamp', 'meter'] + [c for c in CSV_DTYPES if c != 'meter']
+            return pd.DataFrame(columns=columns)
+
+        df = pd.concat(frames, ignore_index=True)
+        df['meter'] = df['meter'].astype(pd.CategoricalDtype(self.meters()))
+        if start is not None:
+            df = df[df['x_Timestamp'] >= pd.Timestamp(start)]
+        if end is not None:
+            df = df[df['x_Timestamp'] <= pd.Timestamp(end)]
+        # Restore the source's time ordering across meters
+        df = df.sort_values('x_Timestamp', kind='stable').reset_index(drop=True)
+        return df[['x_Timestamp', 'meter'] + [c for c in df.columns if c not in ('x_Timestamp', 'meter')]]
+
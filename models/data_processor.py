@@ -1,3 +1,4 @@
+import os
 import pandas as pd
 import numpy as np
 from datetime import datetime, timedelta
@@ -5,24 +6,158 @@ import sqlite3
 import plotly.graph_objs as go
 import plotly.utils
 
+from models.rollups import LazyRollups, partial_rollup, combine_partials
+
+DEFAULT_DATA_PATH = 'data/sample_dataset.csv'
+DEFAULT_MEMORY_BUDGET_MB = 256
+TIMESTAMP_FORMAT = '%Y-%m-%d %H:%M:%S'
+
+READING_COLUMNS = ['t_kWh', 'z_Avg Voltage (Volt)', 'z_Avg Current (Amp)', 'y_Freq (Hz)']
+
+# Explicit dtypes for the streaming loader; timestamps are parsed separately
+CSV_DTYPES = {
+    'meter': 'category',
+    't_kWh': 'float32',
+    'z_Avg Voltage (Volt)': 'float32',
+    'z_Avg Current (Amp)': 'float32',
+    'y_Freq (Hz)': 'float32'
+}
+
+# Rough per-row cost of a chunk while pandas is still parsing CSV text
+# (timestamp strings dominate) and of a row once it is stored compactly.
+PARSE_BYTES_PER_ROW = 320
+STORED_BYTES_PER_ROW = 32
+MAX_PARTIAL_ROLLUPS = 16
+
+DEFAULT_MAX_GAP = '6h'
+
+# Appended batches are buffered and joined into the frame once they reach this
+# share of it (or when the full frame is read), so each append costs time in
+# the batch size rather than the dataset size
+APPEND_FLUSH_FRACTION = 0.05
+MIN_APPEND_FLUSH_ROWS = 10000
+
+
+def fill_meter_gaps(df, columns, max_gap=DEFAULT_MAX_GAP, carry=None):
+    """Forward-fill readings within each meter, never across meters or gaps longer than max_gap
+
+    Rows must be in time order within each meter. `carry` holds each meter's
+    last valid value and its timestamp from earlier rows (e.g. a previous
+    chunk). Returns the filled values, a mask of rows whose t_kWh was imputed,
+    and the updated carry.
+    """
+    n = len(df)
+    timestamps = df.index.values
+    meters = df['meter'].reset_index(drop=True) if 'meter' in df.columns else pd.Series(np.zeros(n, dtype=int))
+    original = df[columns].reset_index(drop=True)
+    ts_cols = [col + '__ts' for col in columns]
+    
+    work = original.copy()
+    for col, ts_col in zip(columns, ts_cols):
+        work[ts_col] = pd.Series(timestamps).where(original[col].notna())
+    
+    if carry is not None and len(carry):
+        # Seed the fill with the carried values as pseudo-rows ahead of the data
+        seeds = carry[carry.index.isin(meters.astype(str).unique())]
+        seed_meters = pd.Series(seeds.index, dtype=str)
+        if isinstance(meters.dtype, pd.CategoricalDtype):
+            seed_meters = seed_meters.astype(meters.dtype)
+        seed_frame = seeds[columns + ts_cols].reset_index(drop=True)
+        work = pd.concat([seed_frame, work], ignore_index=True)
+        keys = pd.concat([seed_meters, meters], ignore_index=True)
+        offset = len(seed_frame)
+    else:
+        keys = meters
+        offset = 0
+    
+    filled = work.groupby(keys, observed=True, sort=False)[columns + ts_cols].ffill()
+    
+    new_carry = filled.groupby(keys, observed=True, sort=False).tail(1)
+    new_carry.index = keys.iloc[new_carry.index].astype(str).to_numpy()
+    if carry is not None:
+        new_carry = new_carry.combine_first(carry)
+    
+    filled = filled.iloc[offset:].reset_index(drop=True)
+    current = pd.Series(timestamps)
+    result = original.copy()
+    imputed = pd.DataFrame(False, index=original.index, columns=columns)
+    for col, ts_col in zip(columns, ts_cols):
+        allowed = original[col].isna() & filled[col].notna()
+        if max_gap is not None:
+            allowed &= (current - filled[ts_col]) <= pd.Timedelta(max_gap)
+        result[col] = original[col].where(~allowed, filled[col])
+        imputed[col] = allowed
+    
+    result.index = df.index
+    is_filled = pd.Series(imputed['t_kWh'].to_numpy() if 't_kWh' in columns else imputed.any(axis=1).to_numpy(),
+                          index=df.index)
+    return result, is_filled, new_carry
+
+
 class DataProcessor:
-    def __init__(self):
+    def __init__(self, data_path=DEFAULT_DATA_PATH, streaming=False,
+                 memory_budget_mb=DEFAULT_MEMORY_BUDGET_MB, use_cache=False,
+                 meters=None, start=None, end=None, max_gap=DEFAULT_MAX_GAP):
         self.df = None
-        self.load_data()
-        self.preprocess_data()
+        self.max_gap = max_gap
+        self._fill_carry = None
+        self.data_path = data_path
+        self.streaming = streaming
+        self.memory_budget_mb = memory_budget_mb
+        self.cache = None
+        self.rollups = LazyRollups(lambda: self.df, budget_mb=memory_budget_mb)
+        if use_cache:
+            self.cache = self._open_cache()
+        if self.cache is not None:
+            self.load_from_cache(meters, start, end)
+            self.preprocess_data()
+        elif streaming:
+            self.load_data_streaming()
+        else:
+            self.load_data()
+            self.preprocess_data()
+        self.data_version = 0
+        self.online_detector = None
+        self.online_forecaster = None
+        self._stats_cache = None
+        self.last_batch_scores = None
+        self.meter_store = self._open_meter_store()
+        self._meter_store_version = self.data_version
+        self.feature_store = None
+    
+    @property
+    def df(self):
+        """All readings, with any buffered appends joined in first"""
+        if self._pending:
+            self._flush_appends()
+        return self._df
+    
+    @df.setter
+    def df(self, value):
+        self._df = value
+        self._pending = []
+        self._pending_rows = 0
+    
+    def _flush_appends(self):
+        """Join the buffered batches into the frame with one concat"""
+        frames = [self._df] + self._pending
+        if isinstance(self._df['meter'].dtype, pd.CategoricalDtype):
+            # The newest batch carries the widest set of meter categories
+            meter_dtype = self._pending[-1]['meter'].dtype
+            frames = [frame.astype({'meter': meter_dtype}) for frame in frames]
+        self.df = pd.concat(frames)
     
     def load_data(self):
         """Load and initial preprocessing of the dataset"""
         try:
-            # Use sample dataset for deployment
-            print("Loading sample dataset...")
-            self.df = pd.read_csv('data/sample_dataset.csv')
+            print(f"Loading dataset {self.data_path}...")
+            self.df = pd.read_csv(self.data_path)
             print(f"Dataset loaded: {self.df.shape}")
         except Exception as e:
             print(f"Error loading data: {e}")
             # Create minimal sample data if file not found
             self.df = pd.DataFrame({
-                'x_Timestamp': pd.date_range('2024-01-01', periods=100, freq='H'),
+                'x_Timestamp': pd.date_range('2024-01-01', periods=100, freq='h'),
                 'meter': ['METER001'] * 100,
                 't_kWh': np.random.uniform(1, 8, 100),
                 'z_Avg Voltage (Volt)': np.random.uniform(220, 240, 100),
@@ -31,70 +166,307 @@ class DataProcessor:
             })
             print("Using generated sample data")
     
+    def _open_cache(self):
+        """Open (building if stale) the columnar cache, or None if unavailable"""
+        from models.columnar_cache import ColumnarCache, PYARROW_AVAILABLE
+        if not PYARROW_AVAILABLE:
+            print("pyarrow not installed, columnar cache disabled")
+            return None
+        try:
+            cache = ColumnarCache(self.data_path)
+            cache.ensure(chunk_rows=self._chunk_rows())
+            return cache
+        except Exception as e:
+            print(f"Error preparing columnar cache: {e}")
+            return None
+    
+    def load_from_cache(self, meters=None, start=None, end=None):
+        """Load only the cached partitions covering the given meters and time range"""
+        print(f"Loading cached partitions for {self.data_path}...")
+        self.df = self.cache.load(meters, start, end)
+        print(f"Dataset loaded from cache: {self.df.shape}")
+    
+    def query(self, meters=None, start=None, end=None):
+        """Raw readings for some meters and time range, read from the cache when enabled"""
+        if self.cache is not None:
+            df = self.cache.load(meters, start, end).set_index('x_Timestamp')
+            df['carbon_emissions'] = df['t_kWh'] * 0.82
+            return df
+        
+        df = self.df
+        if meters is not None:
+            df = df[df['meter'].isin(meters)]
+        if start is not None:
+            df = df[df.index >= pd.Timestamp(start)]
+        if end is not None:
+            df = df[df.index <= pd.Timestamp(end)]
+        return df
+    
+    def _open_meter_store(self):
+        """Open (rebuilding if stale) the memory-mapped per-meter store"""
+        from models.meter_store import MeterStore, DEFAULT_STORE_DIR, data_fingerprint
+        if self.df is None or self.df.empty or 'meter' not in self.df.columns:
+            return None
+        try:
+            name = os.path.splitext(os.path.basename(self.data_path))[0]
+            root = os.path.join(DEFAULT_STORE_DIR, name)
+            fingerprint = data_fingerprint(self.df)
+            store = MeterStore.open(root, fingerprint)
+            if store is None:
+                print("Building per-meter store...")
+                store = MeterStore.build(self.df, root, fingerprint)
+            return store
+        except Exception as e:
+            print(f"Error preparing meter store: {e}")
+            return None
+    
+    def get_feature_store(self):
+        """Open (building if stale) the on-disk model feature store; appends keep it current"""
+        if self.feature_store is not None:
+            return self.feature_store
+        from models.columnar_cache import PYARROW_AVAILABLE
+        from models.feature_store import FeatureStore, DEFAULT_FEATURE_DIR
+        from models.meter_store import data_fingerprint
+        if not PYARROW_AVAILABLE or self.df is None or self.df.empty or 'meter' not in self.df.columns:
+            return None
+        try:
+            name = os.path.splitext(os.path.basename(self.data_path))[0]
+            store = FeatureStore(os.path.join(DEFAULT_FEATURE_DIR, name))
+            store.ensure(self.df, data_fingerprint(self.df), chunk_rows=self._chunk_rows())
+            self.feature_store = store
+        except Exception as e:
+            print(f"Error preparing feature store: {e}")
+        return self.feature_store
+    
+    def load_data_streaming(self):
+        """Load the dataset in chunks sized to the memory budget, building rollups as we go
+
+        The resident frame may use at most half of the budget, since joining the
+        chunks needs a second copy of it. A dataset estimated from its file size,
+        or found while reading, to need more is refused with a MemoryError;
+        open it with use_cache=True and a meter or time filter instead. A chunk
+        that fails to parse or preprocess raises a ValueError naming its rows,
+        rather than falling back to an unbounded full read.
+        """
+        resident_limit = self.memory_budget_mb * 1024 ** 2 / 2
+        estimated = self._estimate_rows() * STORED_BYTES_PER_ROW
+        if estimated > resident_limit:
+            raise MemoryError(self._over_budget_message(estimated))
+        
+        print(f"Streaming dataset {self.data_path} ({self.memory_budget_mb} MB budget)...")
+        chunk_rows = self._chunk_rows()
+        frames = []
+        partials = []
+        carry = None
+        resident = 0
+        first_row = 0
+        reader = pd.read_csv(self.data_path, dtype=CSV_DTYPES, chunksize=chunk_rows)
+        while True:
+            try:
+                chunk = next(reader, None)
+                if chunk is None:
+                    break
+                chunk, carry = self._preprocess_chunk(chunk, carry)
+            except MemoryError:
+                raise
+            except Exception as e:
+                raise ValueError(f"Error streaming {self.data_path} at rows "
+                                 f"{first_row}-{first_row + chunk_rows - 1}: {e}") from e
+            first_row += chunk_rows
+            partials.append(partial_rollup(chunk, 'hourly'))
+            if len(partials) >= MAX_PARTIAL_ROLLUPS:
+                partials = [combine_partials(partials)]
+            resident += chunk.memory_usage(deep=True).sum()
+            if resident > resident_limit:
+                raise MemoryError(self._over_budget_message(resident))
+            frames.append(chunk)
+        
+        if not frames:
+            raise ValueError(f"Dataset {self.data_path} is empty")
+        
+        # Chunks carry their own category sets; unify them before concatenating
+        meters = pd.api.types.union_categoricals([f['meter'] for f in frames])
+        for frame in frames:
+            frame['meter'] = pd.Categorical(frame['meter'], categories=meters.categories)
+        self.df = pd.concat(frames)
+        del frames
+        
+        self.rollups.seed('hourly', combine_partials(partials))
+        self._fill_carry = carry
+        
+        stored_mb = self.df.memory_usage(deep=True).sum() / 1024 ** 2
+        print(f"Dataset streamed: {self.df.shape} ({stored_mb:.1f} MB resident)")
+    
+    def _estimate_rows(self, sample_lines=1000):
+        """Rows in the CSV, estimated from its size and the length of its first lines"""
+        with open(self.data_path, 'rb') as f:
+            f.readline()
+            lengths = [len(line) for _, line in zip(range(sample_lines), f)]
+        if not lengths:
+            return 0
+        return int(os.path.getsize(self.data_path) / (sum(lengths) / len(lengths)))
+    
+    def _over_budget_message(self, resident_bytes):
+        return (f"{self.data_path} needs about {resident_bytes / 1024 ** 2:.1f} MB resident, more than half of "
+                f"the {self.memory_budget_mb} MB budget; load a subset with use_cache=True and meters/start/end")
+    
+    def _chunk_rows(self):
+        """Rows per chunk so that parsing one chunk stays within half of the budget"""
+        budget_bytes = self.memory_budget_mb * 1024 ** 2
+        return max(1000, int(budget_bytes * 0.5 / PARSE_BYTES_PER_ROW))
+    
+    def _preprocess_chunk(self, chunk, carry):
+        """Parse timestamps, forward-fill across chunk boundaries and add emissions"""
+        chunk['x_Timestamp'] = pd.to_datetime(chunk['x_Timestamp'], format=TIMESTAMP_FORMAT)
+        chunk.set_index('x_Timestamp', inplace=True)
+        
+        fill_cols = [col for col in READING_COLUMNS if col in chunk.columns]
+        chunk[fill_cols], chunk['is_filled'], carry = fill_meter_gaps(chunk, fill_cols, self.max_gap, carry)
+        
+        chunk['carbon_emissions'] = chunk['t_kWh'] * np.float32(0.82)
+        return chunk, carry
+    
     def preprocess_data(self):
         """Optimized data preprocessing for large datasets"""
         if self.df.empty:
             return
         
-        print("Converting timestamps...")
-        self.df['x_Timestamp'] = pd.to_datetime(self.df['x_Timestamp'])
+        if not pd.api.types.is_datetime64_any_dtype(self.df['x_Timestamp']):
+            print("Converting timestamps...")
+            self.df['x_Timestamp'] = pd.to_datetime(self.df['x_Timestamp'])
         self.df.set_index('x_Timestamp', inplace=True)
         
+        if not self.df.index.is_monotonic_increasing:
+            self.df.sort_index(kind='stable', inplace=True)
+        
         print("Handling missing values...")
-        # Use faster fillna methods
-        self.df['t_kWh'].fillna(method='ffill', inplace=True)
-        if 'z_Avg Voltage (Volt)' in self.df.columns:
-            self.df['z_Avg Voltage (Volt)'].fillna(method='ffill', inplace=True)
-        if 'z_Avg Current (Amp)' in self.df.columns:
-            self.df['z_Avg Current (Amp)'].fillna(method='ffill', inplace=True)
-        if 'y_Freq (Hz)' in self.df.columns:
-            self.df['y_Freq (Hz)'].fillna(method='ffill', inplace=True)
+        fill_cols = [col for col in READING_COLUMNS if col in self.df.columns]
+        self.df[fill_cols], self.df['is_filled'], self._fill_carry = fill_meter_gaps(
+            self.df, fill_cols, self.max_gap)
         
         print("Calculating carbon emissions...")
         self.df['carbon_emissions'] = self.df['t_kWh'] * 0.82
         
-        print("Creating aggregated data...")
-        # Create resampled versions
-        agg_dict = {
-            't_kWh': 'sum',
-            'carbon_emissions': 'sum'
-        }
-        
-        # Add optional columns if they exist
-        if 'z_Avg Voltage (Volt)' in self.df.columns:
-            agg_dict['z_Avg Voltage (Volt)'] = 'mean'
-        if 'z_Avg Current (Amp)' in self.df.columns:
-            agg_dict['z_Avg Current (Amp)'] = 'mean'
-        if 'y_Freq (Hz)' in self.df.columns:
-            agg_dict['y_Freq (Hz)'] = 'mean'
-        
-        if 'meter' in self.df.columns:
-            self.hourly_data = self.df.groupby(['meter']).resample('H').agg(agg_dict).reset_index()
-            self.daily_data = self.df.groupby(['meter']).resample('D').agg(agg_dict).reset_index()
-        else:
-            self.hourly_data = self.df.resample('H').agg(agg_dict).reset_index()
-            self.daily_data = self.df.resample('D').agg(agg_dict).reset_index()
+        # Hourly/daily rollups are computed lazily on first access
+        self.rollups.release()
         
         print("Data preprocessing completed")
     
+    def append_readings(self, batch):
+        """Append new meter readings and update materialized rollups incrementally"""
+        batch = pd.DataFrame(batch).copy()
+        if batch.empty:
+            return 0
+        
+        batch['x_Timestamp'] = pd.to_datetime(batch['x_Timestamp'])
+        batch = batch.sort_values('x_Timestamp', kind='stable').set_index('x_Timestamp')
+        batch = batch.reindex(columns=[col for col in self._df.columns
+                                       if col not in ('carbon_emissions', 'is_filled')])
+        
+        # Forward-fill from each meter's last known reading, not the previous row
+        fill_cols = [col for col in READING_COLUMNS if col in batch.columns]
+        batch[fill_cols], batch['is_filled'], self._fill_carry = fill_meter_gaps(
+            batch, fill_cols, self.max_gap, self._fill_carry)
+        
+        batch['carbon_emissions'] = batch['t_kWh'] * 0.82
+        
+        dtypes = self._df.dtypes.to_dict()
+        if isinstance(dtypes['meter'], pd.CategoricalDtype):
+            # Widen the categories on the batch only; the frame is recoded when flushed
+            meter_dtype = self._pending[-1]['meter'].dtype if self._pending else dtypes['meter']
+            new_meters = pd.Index(batch['meter'].astype(str).unique()).difference(meter_dtype.categories)
+            if len(new_meters):
+                meter_dtype = pd.CategoricalDtype(meter_dtype.categories.append(new_meters))
+            dtypes['meter'] = meter_dtype
+        batch = batch[self._df.columns].astype(dtypes)
+        
+        if self.online_detector is not None:
+            self.last_batch_scores = self.online_detector.score_batch(
+                batch['meter'].astype(str), batch.index, batch['t_kWh'])
+        
+        self._pending.append(batch)
+        self._pending_rows += len(batch)
+        if self._pending_rows >= max(MIN_APPEND_FLUSH_ROWS, len(self._df) * APPEND_FLUSH_FRACTION):
+            self._flush_appends()
+        self.rollups.merge(batch)
+        if self.meter_store is not None:
+            self.meter_store.append(batch['meter'].astype(str).to_numpy(), batch.index.values,
+                                    batch['t_kWh'].to_numpy())
+        if self.feature_store is not None:
+            batch_features = self.feature_store.append(batch)
+            if self.online_forecaster is not None:
+                self.online_forecaster.partial_fit(batch_features)
+
+        self.data_version += 1
+        return len(batch)
+    
+    def enable_online_detection(self, checkpoint_path=None, **kwargs):
+        """Score every appended batch with an online detector, restored or warmed from history"""
+        from models.online_anomaly import OnlineAnomalyDetector
+        if checkpoint_path and os.path.exists(checkpoint_path):
+            self.online_detector = OnlineAnomalyDetector.load(checkpoint_path)
+        else:
+            self.online_detector = OnlineAnomalyDetector(**kwargs)
+            if not self.df.empty:
+                self.online_detector.update(self.df['meter'], self.df.index, self.df['t_kWh'])
+        return self.online_detector
+    
+    def enable_online_forecasting(self, checkpoint_path=None, **kwargs):
+        """Keep an incrementally trained forecaster fresh from every appended batch"""
+        from models.online_forecaster import OnlineForecaster
+        feature_store = self.get_feature_store()
+        if feature_store is None:
+            print("Online forecasting needs the feature store")
+            return None
+        if checkpoint_path and os.path.exists(checkpoint_path):
+            self.online_forecaster = OnlineForecaster.load(checkpoint_path)
+        else:
+            self.online_forecaster = OnlineForecaster(checkpoint_path=checkpoint_path, **kwargs)
+            self.online_forecaster.fit_chunks(feature_store.chunks())
+        return self.online_forecaster
+    
+    @property
+    def hourly_data(self):
+        return self.rollups.get('hourly')
+    
+    @property
+    def daily_data(self):
+        return self.rollups.get('daily')
+    
+    def _data_fingerprint(self):
+        """Cheap identity of the current frame contents, bumped by every append"""
+        return (self.data_version, id(self.df), self.df.shape)
+    
+    def get_dataset_stats(self):
+        """Fused single-pass dataset statistics, cached against the data fingerprint"""
+        from models.dataset_stats import compute_dataset_stats
+        fingerprint = self._data_fingerprint()
+        if self._stats_cache is None or self._stats_cache[0] != fingerprint:
+            stats = compute_dataset_stats(self.df)
+            stats['date_range'] = {
+                'start': self.df.index.min().strftime('%Y-%m-%d'),
+                'end': self.df.index.max().strftime('%Y-%m-%d')
+            }
+            stats['unique_meters'] = self.df['meter'].nunique()
+            self._stats_cache = (fingerprint, stats)
+        return self._stats_cache[1]
+    
     def get_dataset_overview(self):
         """Generate comprehensive dataset overview"""
         if self.df.empty:
             return {}
         
+        stats = self.get_dataset_stats()
         overview = {
             'shape': self.df.shape,
             'columns': list(self.df.columns),
             'dtypes': self.df.dtypes.to_dict(),
-            'missing_values': self.df.isnull().sum().to_dict(),
-            'statistics': self.df.describe().to_dict(),
-            'date_range': {
-                'start': self.df.index.min().strftime('%Y-%m-%d'),
-                'end': self.df.index.max().strftime('%Y-%m-%d')
-            },
-            'unique_meters': self.df['meter'].nunique(),
-            'total_consumption': self.df['t_kWh'].sum(),
-            'total_emissions': self.df['carbon_emissions'].sum()
+            'missing_values': stats['missing'],
+            'statistics': stats['describe'],
+            'date_range': stats['date_range'],
+            'unique_meters': stats['unique_meters'],
+            'total_consumption': stats['sum']['t_kWh'],
+            'total_emissions': stats['sum']['carbon_emissions']
         }
         return overview
     
@@ -108,36 +480,57 @@ class DataProcessor:
             if col in self.df.columns:
                 numeric_cols.append(col)
         
-        corr_matrix = self.df[numeric_cols].corr()
+        corr_matrix = self.get_dataset_stats()['correlation'].loc[numeric_cols, numeric_cols]
         return corr_matrix.to_dict()
     
+    def get_anomaly_scores(self, **kwargs):
+        """Per-reading rolling z-score, IQR and MAD scores for every meter (columnar)"""
+        from models.anomaly_detection import detect_anomalies_vectorized
+        return detect_anomalies_vectorized(self.df, **kwargs)
+    
     def detect_anomalies(self):
         """Detect anomalies in energy consumption"""
         if self.df.empty:
             return []
         
-        # Using Z-score method
-        z_scores = np.abs((self.df['t_kWh'] - self.df['t_kWh'].mean()) / self.df['t_kWh'].std())
-        anomalies = self.df[z_scores > 3]
+        scores = self.get_anomaly_scores()
+        anomalies = scores[scores['is_anomaly'].to_numpy()]
         
-        return [{
-            'timestamp': idx.strftime('%Y-%m-%d %H:%M'),
-            'consumption': row['t_kWh'],
-            'meter': row['meter'],
-            'z_score': z_scores.loc[idx]
-        } for idx, row in anomalies.iterrows()]
+        return pd.DataFrame({
+            'timestamp': pd.DatetimeIndex(anomalies['timestamp']).strftime('%Y-%m-%d %H:%M'),
+            'consumption': anomalies['consumption'].to_numpy(),
+            'meter': anomalies['meter'].astype(str).to_numpy(),
+            'z_score': np.abs(anomalies['z_score'].to_numpy())
+        }).to_dict('records')
+    
+    def _has_meter(self, meter_id):
+        if self.meter_store is None and self._meter_store_version != self.data_version:
+            # Started without readings: build the store once appends brought some
+            self.meter_store = self._open_meter_store()
+            self._meter_store_version = self.data_version
+        return self.meter_store is not None and meter_id in self.meter_store
     
-    def get_user_data(self, meter_id):
-        """Get data for specific user/meter"""
+    def get_user_data(self, meter_id, days=30):
+        """Get daily data for specific user/meter"""
         if not meter_id:
             return pd.DataFrame()
         
-        # Generate sample data for demo
+        if not self._has_meter(meter_id):
+            return self._demo_user_data(meter_id, days)
+        
+        dates, consumption = self.meter_store.daily_totals(meter_id, days)
+        return pd.DataFrame({
+            'x_Timestamp': pd.DatetimeIndex(dates).date,
+            't_kWh': consumption,
+            'carbon_emissions': consumption * 0.82
+        })
+    
+    def _demo_user_data(self, meter_id, days=30):
+        """Seeded sample data for meters that are not in the dataset"""
         import random
-        from datetime import timedelta
         
         random.seed(hash(meter_id) % 1000)
-        dates = [datetime.now().date() - timedelta(days=i) for i in range(30)]
+        dates = [datetime.now().date() - timedelta(days=i) for i in range(days)]
         data = []
         
         for date in dates:
@@ -151,54 +544,73 @@ class DataProcessor:
         return pd.DataFrame(data)
     
     def get_today_usage(self, meter_id):
-        """Get today's energy usage for user"""
+        """Get today's energy usage for user (the meter's latest day of readings)"""
         if not meter_id:
             return 0
         
-        # Generate sample data for demo
-        import random
-        random.seed(hash(meter_id) % 1000)
-        return round(random.uniform(1.5, 8.0), 2)
+        if not self._has_meter(meter_id):
+            import random
+            random.seed(hash(meter_id) % 1000)
+            return round(random.uniform(1.5, 8.0), 2)
+        
+        _, consumption = self.meter_store.daily_totals(meter_id, 1)
+        return round(float(consumption[-1]), 2)
     
     def get_chart_data(self, meter_id, chart_type='daily'):
         """Generate chart data for frontend"""
-        user_data = self.get_user_data(meter_id)
-        
-        if user_data.empty:
+        if not meter_id:
             return {'labels': [], 'consumption': [], 'emissions': []}
         
-        data = user_data.tail(30) if chart_type == 'daily' else user_data.tail(7)
+        days = 30 if chart_type == 'daily' else 7
+        if not self._has_meter(meter_id):
+            data = self._demo_user_data(meter_id, days)
+            return {
+                'labels': [d.strftime('%Y-%m-%d') for d in data['x_Timestamp']],
+                'consumption': data['t_kWh'].tolist(),
+                'emissions': data['carbon_emissions'].tolist()
+            }
         
+        dates, consumption = self.meter_store.daily_totals(meter_id, days)
         return {
-            'labels': [d.strftime('%Y-%m-%d') for d in data['x_Timestamp']],
-            'consumption': data['t_kWh'].tolist(),
-            'emissions': data['carbon_emissions'].tolist()
+            'labels': np.datetime_as_string(dates, unit='D').tolist(),
+            'consumption': consumption.tolist(),
+            'emissions': (consumption * 0.82).tolist()
         }
     
+    def get_rollup(self, column='t_kWh', granularity='daily', start=None, end=None, meters=None):
+        """sum/mean/min/max/count of a column per meter and bucket, from the rollup pyramid"""
+        return self.rollups.query(column, granularity, start, end, meters)
+    
     def get_insights(self):
         """Generate automated insights from the data"""
         if self.df.empty:
             return []
         
         insights = []
+        hourly = self.rollups.level('hourly')
+        daily = self.rollups.level('daily')
         
-        # Peak usage time
-        hourly_avg = self.df.groupby(self.df.index.hour)['t_kWh'].mean()
+        # Peak usage time (mean per reading, weighted through the hourly sums/counts)
+        hours = hourly.index.get_level_values('x_Timestamp').hour
+        hourly_totals = hourly[['t_kWh', 't_kWh__count']].groupby(hours).sum()
+        hourly_avg = hourly_totals['t_kWh'] / hourly_totals['t_kWh__count']
         peak_hour = hourly_avg.idxmax()
         insights.append(f"Peak energy usage occurs at {peak_hour}:00 with average {hourly_avg.max():.2f} kWh")
         
         # Weekly patterns
-        daily_avg = self.df.groupby(self.df.index.dayofweek)['t_kWh'].mean()
+        weekdays = daily.index.get_level_values('x_Timestamp').dayofweek
+        daily_totals = daily[['t_kWh', 't_kWh__count']].groupby(weekdays).sum()
+        daily_avg = daily_totals['t_kWh'] / daily_totals['t_kWh__count']
         peak_day = ['Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday', 'Sunday'][daily_avg.idxmax()]
         insights.append(f"Highest consumption day is {peak_day} with {daily_avg.max():.2f} kWh average")
         
         # Efficiency insights
-        avg_voltage = self.df['z_Avg Voltage (Volt)'].mean()
+        avg_voltage = daily['z_Avg Voltage (Volt)'].sum() / daily['z_Avg Voltage (Volt)__count'].sum()
         if avg_voltage < 220:
             insights.append("Voltage levels are below optimal (220V), which may indicate inefficiency")
         
         # Carbon footprint
-        total_emissions = self.df['carbon_emissions'].sum()
+        total_emissions = daily['carbon_emissions'].sum()
         insights.append(f"Total carbon footprint: {total_emissions:.2f} kg CO₂")
         
-        return insights
\ No newline at end of file
+        return insights
@@ -0,0 +1,101 @@
+import numpy as np
+import pandas as pd
+
+DEFAULT_CHUNK_ROWS = 1000000
+PERCENTILES = [25, 50, 75]
+
+
+def compute_dataset_stats(df, numeric_cols=None, chunk_rows=DEFAULT_CHUNK_ROWS):
+    """Counts, moments, min/max, missing counts and pairwise covariance in one chunked pass
+
+    Products are accumulated with masks so the covariance and correlation use
+    pairwise-complete rows, matching pandas' DataFrame.cov()/corr(). The
+    quartiles are exact, like DataFrame.describe(), so they cost one extra
+    pass: a partial sort of each numeric column after the chunked pass.
+    """
+    if numeric_cols is None:
+        numeric_cols = list(df.select_dtypes('number').columns)
+    other_cols = [col for col in df.columns if col not in numeric_cols]
+    k = len(numeric_cols)
+
+    pair_n = np.zeros((k, k))
+    pair_sum = np.zeros((k, k))
+    pair_sq = np.zeros((k, k))
+    cross = np.zeros((k, k))
+    mins = np.full(k, np.inf)
+    maxs = np.full(k, -np.inf)
+    missing = pd.Series(0, index=df.columns, dtype='int64')
+    shift = None
+
+    for start in range(0, len(df), chunk_rows):
+        chunk = df.iloc[start:start + chunk_rows]
+        X = chunk[numeric_cols].to_numpy(dtype='float64')
+        valid = ~np.isnan(X)
+        if shift is None:
+            # Shift by a rough mean so the sums of squares do not cancel catastrophically
+            with np.errstate(invalid='ignore'):
+                shift = np.nan_to_num(np.nanmean(X, axis=0)) if len(X) else np.zeros(k)
+        X0 = np.where(valid, X - shift, 0.0)
+        W = valid.astype('float64')
+
+        pair_n += W.T @ W
+        pair_sum += X0.T @ W
+        pair_sq += (X0 * X0).T @ W
+        cross += X0.T @ X0
+        mins = np.fmin(mins, np.where(valid, X, np.inf).min(axis=0, initial=np.inf))
+        maxs = np.fmax(maxs, np.where(valid, X, -np.inf).max(axis=0, initial=-np.inf))
+
+        missing[numeric_cols] += (~valid).sum(axis=0)
+        if other_cols:
+            missing[other_cols] += chunk[other_cols].isna().sum().to_numpy()
+
+    if shift is None:
+        shift = np.zeros(k)
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        counts = np.diag(pair_n)
+        sums = np.diag(pair_sum)
+        mean = sums / counts + shift
+        var = (np.diag(pair_sq) - sums ** 2 / counts) / (counts - 1)
+
+        cov = (cross - pair_sum * pair_sum.T / pair_n) / (pair_n - 1)
+        var_given = (pair_sq - pair_sum ** 2 / pair_n) / (pair_n - 1)
+        corr = cov / np.sqrt(var_given * var_given.T)
+    np.fill_diagonal(corr, np.where(counts > 1, 1.0, np.nan))
+
+    mins[counts == 0] = np.nan
+    maxs[counts == 0] = np.nan
+
+    # Exact quartiles need the whole column; a mergeable sketch would fit in the
+    # chunked pass above but only approximate what the describe table shows
+    quantiles = {}
+    for i, col in enumerate(numeric_cols):
+        values = df[col].to_numpy(dtype='float64')
+        if counts[i]:
+            quantiles[col] = np.nanpercentile(values, PERCENTILES)
+        else:
+            quantiles[col] = [np.nan] * len(PERCENTILES)
+
+    describe = {}
+    for i, col in enumerate(numeric_cols):
+        describe[col] = {
+            'count': counts[i],
+            'mean': mean[i],
+            'std': np.sqrt(var[i]),
+            'min': mins[i],
+            '25%': quantiles[col][0],
+            '50%': quantiles[col][1],
+            '75%': quantiles[col][2],
+            'max': maxs[i]
+        }
+
+    return {
+        'rows': len(df),
+        'columns': numeric_cols,
+        'count': dict(zip(numeric_cols, counts)),
+        'sum': dict(zip(numeric_cols, sums + shift * counts)),
+        'missing': missing.to_dict(),
+        'describe': describe,
+        'covariance': pd.DataFrame(cov, index=numeric_cols, columns=numeric_cols),
+        'correlation': pd.DataFrame(corr, index=numeric_cols, columns=numeric_cols)
+    }
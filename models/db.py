@@ -0,0 +1,69 @@
+import os
+import sqlite3
+import threading
+from contextlib import contextmanager
+
+DB_PATH = 'energy_app.db'
+CACHED_STATEMENTS = 256
+BUSY_TIMEOUT_MS = 5000
+
+# Applied to every new connection; WAL lets readers run alongside a writer
+PRAGMAS = [
+    'PRAGMA journal_mode=WAL',
+    'PRAGMA synchronous=NORMAL',
+    f'PRAGMA busy_timeout={BUSY_TIMEOUT_MS}',
+    'PRAGMA temp_store=MEMORY',
+    'PRAGMA cache_size=-8000'
+]
+
+_local = threading.local()
+
+
+def _connect(path):
+    conn = sqlite3.connect(path, timeout=BUSY_TIMEOUT_MS / 1000, cached_statements=CACHED_STATEMENTS)
+    for pragma in PRAGMAS:
+        conn.execute(pragma)
+    return conn
+
+
+def get_connection(path=DB_PATH):
+    """The calling thread's cached connection to the app database
+
+    Each thread (Streamlit runs every session in its own) opens one
+    connection per database file and reuses it, so repeated queries skip
+    connect/close and hit the connection's prepared-statement cache. Writes
+    go through transaction(); callers must not close the connection.
+    """
+    connections = getattr(_local, 'connections', None)
+    if connections is None:
+        connections = _local.connections = {}
+    key = os.path.abspath(path)
+    conn = connections.get(key)
+    if conn is None:
+        conn = connections[key] = _connect(path)
+    return conn
+
+
+@contextmanager
+def transaction(path=DB_PATH):
+    """The calling thread's connection inside one write transaction
+
+    Takes the write lock up front, commits when the block completes and rolls
+    back on any exception, so a failed write never leaves the shared
+    connection holding a half-done transaction.
+    """
+    conn = get_connection(path)
+    conn.execute('BEGIN IMMEDIATE')
+    try:
+        yield conn
+    except BaseException:
+        conn.rollback()
+        raise
+    conn.commit()
+
+
+def close_connection(path=DB_PATH):
+    """Close the calling thread's connection, if it has one"""
+    conn = getattr(_local, 'connections', {}).pop(os.path.abspath(path), None)
+    if conn is not None:
+        conn.close()
@@ -0,0 +1,256 @@
+import os
+import shutil
+from urllib.parse import quote
+import numpy as np
+import pandas as pd
+
+from models.features import (FEATURE_COLUMNS, LAGS, DEFAULT_CHUNK_ROWS, RAW_COLUMNS, HOURLY_COLUMNS,
+                             add_features, feature_chunks, hourly_readings)
+from models.meter_store import meter_order
+from models.columnar_cache import read_manifest, write_manifest
+
+DEFAULT_FEATURE_DIR = 'data/features'
+STORE_FORMAT_VERSION = 2
+
+# Appends add one part per meter; past this many a meter's parts are merged
+MAX_PARTS_PER_METER = 32
+
+# Hours before a meter's last stored hour that the features of new hours can
+# depend on; the tail also keeps the last hour since new readings may add to it
+TAIL_HOURS = max(LAGS)
+
+class FeatureStore:
+    """Parquet table of hourly model features keyed by meter and hour, one directory of part files per meter
+
+    Built once from the full dataset; appended readings only recompute the
+    hours they touch, using the last TAIL_HOURS stored hours of each meter as
+    context. Part files form an append-only log: a later row for the same hour
+    replaces an earlier one. A meter's live parts run from its `first_part` to
+    `parts`; once there are more than MAX_PARTS_PER_METER they are compacted.
+    """
+
+    def __init__(self, root, feature_cols=FEATURE_COLUMNS):
+        self.root = root
+        self.feature_cols = list(feature_cols)
+        self.columns = HOURLY_COLUMNS + [col for col in self.feature_cols if col not in HOURLY_COLUMNS]
+        self.manifest = read_manifest(self.root)
+        self._tails = {}
+
+    def _meter_dir(self, meter, root=None):
+        return os.path.join(root or self.root, 'meter=' + quote(meter, safe=''))
+
+    def _write_part(self, meter, frame, root=None):
+        """Write one meter's rows as the next part file and record it"""
+        info = self.manifest['meters'].setdefault(
+            meter, {'first_part': 0, 'parts': 0, 'rows': 0, 'last_timestamp': None})
+        meter_dir = self._meter_dir(meter, root)
+        os.makedirs(meter_dir, exist_ok=True)
+        frame = frame[self.columns].rename_axis('x_Timestamp').reset_index()
+        frame.to_parquet(os.path.join(meter_dir, f"part-{info['parts']:05d}.parquet"), index=False)
+        info['parts'] += 1
+        # Rows rewriting an hour that is already stored do not add to the count
+        if info['last_timestamp'] is None:
+            info['rows'] += len(frame)
+        else:
+            info['rows'] += int((frame['x_Timestamp'] > pd.Timestamp(info['last_timestamp'])).sum())
+        last = frame['x_Timestamp'].max()
+        if info['last_timestamp'] is None or last > pd.Timestamp(info['last_timestamp']):
+            info['last_timestamp'] = last.isoformat()
+
+    def is_valid(self, fingerprint):
+        """True if the store was built from this data with the same feature set"""
+        return (self.manifest is not None
+                and self.manifest.get('format_version') == STORE_FORMAT_VERSION
+                and self.manifest.get('feature_columns') == self.feature_cols
+                and self.manifest.get('fingerprint') == fingerprint
+                and not self.manifest.get('appended'))
+
+    def build(self, df, fingerprint, chunk_rows=DEFAULT_CHUNK_ROWS):
+        """Materialize features for the whole dataset, a chunk of meters at a time"""
+        print("Building feature store...")
+        build_root = self.root + '.building'
+        shutil.rmtree(build_root, ignore_errors=True)
+        os.makedirs(build_root)
+        self.manifest = {
+            'format_version': STORE_FORMAT_VERSION,
+            'fingerprint': fingerprint,
+            'feature_columns': self.feature_cols,
+            'appended': False,
+            'meters': {}
+        }
+        for chunk in feature_chunks(hourly_readings(df), chunk_rows):
+            for meter, part in chunk.groupby(chunk['meter'].astype(str), sort=False):
+                self._write_part(meter, part, root=build_root)
+        write_manifest(build_root, self.manifest)
+
+        # Swap the finished build in so readers never see a half-written store
+        shutil.rmtree(self.root, ignore_errors=True)
+        os.replace(build_root, self.root)
+        self._tails = {}
+        print(f"Feature store built: {self.rows()} rows for {len(self.meters())} meters")
+
+    def ensure(self, df, fingerprint, chunk_rows=DEFAULT_CHUNK_ROWS):
+        """Rebuild the store if the data or the feature set changed"""
+        if not self.is_valid(fingerprint):
+            self.build(df, fingerprint, chunk_rows)
+
+    def meters(self):
+        return sorted(self.manifest['meters']) if self.manifest else []
+
+    def rows(self):
+        return sum(info['rows'] for info in self.manifest['meters'].values()) if self.manifest else 0
+
+    def load_meter(self, meter):
+        """All feature rows of one meter, in time order"""
+        info = self.manifest['meters'][meter]
+        meter_dir = self._meter_dir(meter)
+        parts = [pd.read_parquet(os.path.join(meter_dir, f'part-{i:05d}.parquet'))
+                 for i in range(info.get('first_part', 0), info['parts'])]
+        frame = _latest_rows(pd.concat(parts, ignore_index=True))
+        frame.insert(0, 'meter', meter)
+        return frame
+
+    def chunks(self, meters=None, chunk_rows=DEFAULT_CHUNK_ROWS):
+        """Feature frames of whole meters, roughly `chunk_rows` rows each"""
+        frames = []
+        rows = 0
+        for meter in (meters if meters is not None else self.meters()):
+            frame = self.load_meter(meter)
+            frames.append(frame)
+            rows += len(frame)
+            if rows >= chunk_rows:
+                yield pd.concat(frames)
+                frames = []
+                rows = 0
+        if frames:
+            yield pd.concat(frames)
+
+    def tail(self, meter):
+        """Feature rows of a meter's last TAIL_HOURS hours and its last hour, reading only the newest parts"""
+        if meter not in self._tails:
+            info = self.manifest['meters'][meter]
+            meter_dir = self._meter_dir(meter)
+            cutoff = pd.Timestamp(info['last_timestamp']) - pd.Timedelta(hours=TAIL_HOURS)
+            parts = []
+            for i in range(info['parts'] - 1, info.get('first_part', 0) - 1, -1):
+                part = pd.read_parquet(os.path.join(meter_dir, f'part-{i:05d}.parquet'))
+                parts.insert(0, part)
+                if part['x_Timestamp'].min() <= cutoff:
+                    break
+            frame = _latest_rows(pd.concat(parts, ignore_index=True))
+            frame.insert(0, 'meter', meter)
+            self._tails[meter] = frame[frame.index >= cutoff]
+        return self._tails[meter]
+
+    def latest(self, meters=None):
+        """Hourly rows of every meter's last TAIL_HOURS hours in the rollup layout the forecaster reads"""
+        tails = [self.tail(meter) for meter in (meters if meters is not None else self.meters())]
+        if not tails:
+            return pd.DataFrame(columns=['meter', 'x_Timestamp'] + self.columns)
+        return pd.concat(tails).reset_index()
+
+    def _compact(self, meter):
+        """Merge a meter's live parts into one new part; returns the files it replaced"""
+        info = self.manifest['meters'][meter]
+        frame = self.load_meter(meter).drop(columns='meter')
+        stale = [os.path.join(self._meter_dir(meter), f'part-{i:05d}.parquet')
+                 for i in range(info.get('first_part', 0), info['parts'])]
+        frame.rename_axis('x_Timestamp').reset_index().to_parquet(
+            os.path.join(self._meter_dir(meter), f"part-{info['parts']:05d}.parquet"), index=False)
+        info['first_part'] = info['parts']
+        info['parts'] += 1
+        return stale
+
+    def append(self, batch):
+        """Add features for newly appended readings, recomputing only the hours they affect
+
+        Readings are summed into hours first; readings for a meter's last stored
+        hour are folded into it. A meter that receives readings for an earlier
+        hour is rewritten. Returns the feature rows of hours that are complete
+        now, i.e. touched or previously last, and older than the meter's new last hour.
+        """
+        if batch.empty:
+            return pd.DataFrame(columns=['meter'] + self.columns)
+        hourly = hourly_readings(batch)
+        hourly['meter'] = hourly['meter'].astype(str)
+        first_new = hourly.index.to_series().groupby(hourly['meter'].values).min()
+
+        contexts = []
+        rewrite = []
+        previous_last = {}
+        for meter, first in first_new.items():
+            info = self.manifest['meters'].get(meter)
+            if info is None:
+                continue
+            previous_last[meter] = pd.Timestamp(info['last_timestamp'])
+            if first < previous_last[meter]:
+                rewrite.append(meter)
+                contexts.append(self.load_meter(meter)[['meter'] + HOURLY_COLUMNS])
+            else:
+                contexts.append(self.tail(meter)[['meter'] + HOURLY_COLUMNS])
+
+        context = pd.concat(contexts) if contexts else hourly.iloc[:0]
+        combined = _combine_hours(pd.concat([context.assign(is_new=False), hourly.assign(is_new=True)]))
+        order, group_starts = meter_order(combined)
+        features = add_features(combined.iloc[order], group_starts)
+
+        completed = []
+        for meter, rows in features.groupby('meter', sort=False):
+            hours = rows.index
+            completed.append(rows[(hours < hours.max())
+                                  & (rows['is_new'].to_numpy() | (hours == previous_last.get(meter, pd.NaT)))])
+            if meter in rewrite:
+                shutil.rmtree(self._meter_dir(meter), ignore_errors=True)
+                self.manifest['meters'].pop(meter)
+                self._tails.pop(meter, None)
+            else:
+                rows = rows[rows['is_new']]
+                if meter in self._tails:
+                    tail = pd.concat([self._tails[meter], rows[self._tails[meter].columns]])
+                    tail = tail[~tail.index.duplicated(keep='last')]
+                    self._tails[meter] = tail[tail.index >= tail.index.max() - pd.Timedelta(hours=TAIL_HOURS)]
+            self._write_part(meter, rows)
+
+        stale = []
+        for meter in first_new.index:
+            info = self.manifest['meters'][meter]
+            if info['parts'] - info.get('first_part', 0) > MAX_PARTS_PER_METER:
+                stale.extend(self._compact(meter))
+
+        self.manifest['appended'] = True
+        write_manifest(self.root, self.manifest)
+        # Replaced parts go only once the manifest no longer points at them
+        for path in stale:
+            os.remove(path)
+        return pd.concat(completed).drop(columns='is_new')
+
+
+def _latest_rows(parts):
+    """Part rows indexed by hour, keeping the last written row of each hour"""
+    frame = parts.set_index('x_Timestamp').sort_index(kind='stable')
+    return frame[~frame.index.duplicated(keep='last')]
+
+
+def _combine_hours(frame):
+    """Merge rows of the same meter and hour, e.g. a stored hour and new readings for it
+
+    kWh and reading counts add up; voltage, current and frequency are averaged
+    weighted by the readings behind each row.
+    """
+    keys = [frame['meter'].values, frame.index.rename('x_Timestamp')]
+    if not pd.MultiIndex.from_arrays(keys).duplicated().any():
+        return frame
+    mean_cols = [col for col in RAW_COLUMNS if col != 't_kWh']
+    weights = frame['readings'].to_numpy(dtype='float64')
+    weighted = frame[mean_cols].mul(weights, axis=0).assign(weight=weights)
+    grouped = weighted.groupby(keys, sort=True)
+    sums = grouped.sum()
+    combined = pd.DataFrame({
+        't_kWh': frame['t_kWh'].groupby(keys, sort=True).sum(min_count=1),
+        'readings': frame['readings'].groupby(keys, sort=True).sum(),
+        'is_new': frame['is_new'].groupby(keys, sort=True).any()
+    })
+    for col in mean_cols:
+        combined[col] = sums[col] / sums['weight'].replace(0, np.nan)
+    combined = combined.reset_index(level=0).rename(columns={'level_0': 'meter'})
+    return combined[['meter'] + HOURLY_COLUMNS + ['is_new']]
@@ -0,0 +1,131 @@
+import numpy as np
+import pandas as pd
+from models.meter_store import meter_order
+from models.rollups import partial_rollup, finalize_rollup
+
+DEFAULT_CHUNK_ROWS = 1000000
+# Lags and windows are in hours; features are built on hourly sums per meter
+LAGS = [1, 24, 168]
+ROLLING_WINDOW = 24
+
+RAW_COLUMNS = ['t_kWh', 'z_Avg Voltage (Volt)', 'z_Avg Current (Amp)', 'y_Freq (Hz)']
+# Hourly columns: kWh summed, the rest averaged, plus the number of kWh readings summed
+HOURLY_COLUMNS = RAW_COLUMNS + ['readings']
+
+FEATURE_COLUMNS = ['hour', 'day_of_week', 'month', 'is_weekend',
+                   'consumption_lag1', 'consumption_lag24', 'consumption_lag168',
+                   'consumption_rolling_mean_24h', 'consumption_rolling_std_24h',
+                   'z_Avg Voltage (Volt)', 'z_Avg Current (Amp)', 'y_Freq (Hz)', 'power_factor']
+
+
+def _meter_chunks(group_starts, n, chunk_rows):
+    """Split sorted rows into chunks of whole meters of roughly `chunk_rows` rows"""
+    bounds = np.append(group_starts, n)
+    start = 0
+    for i in range(1, len(bounds)):
+        if bounds[i] - start >= chunk_rows or i == len(bounds) - 1:
+            if bounds[i] > start:
+                yield start, bounds[i]
+            start = bounds[i]
+
+
+def hourly_readings(df):
+    """Hourly kWh sums and mean voltage, current and frequency per meter
+
+    Returns one row per meter and hour, sorted by meter and time and indexed
+    by the start of the hour. Hours without a kWh reading have NaN kWh.
+    """
+    columns = [col for col in ['meter'] + RAW_COLUMNS if col in df.columns]
+    partial = partial_rollup(df[columns], 'hourly')
+    hourly = finalize_rollup(partial)
+    hourly['readings'] = partial['t_kWh__count'].to_numpy().astype('int64')
+    hourly.loc[hourly['readings'] == 0, 't_kWh'] = np.nan
+    return hourly.set_index('x_Timestamp')
+
+
+def add_features(chunk, group_starts):
+    """Calendar, lag, rolling and power-factor features for hourly rows sorted by meter and time
+
+    `group_starts` are the positions where each meter's run begins. Rows are
+    placed on a per-meter hourly grid, so lags and windows count hours even
+    when hours are missing. They never reach across meters, and every feature
+    only looks at hours before the one being predicted.
+    """
+    chunk = chunk.copy()
+    n = len(chunk)
+    values = chunk['t_kWh'].to_numpy(dtype='float64')
+    group = np.searchsorted(group_starts, np.arange(n), side='right') - 1
+    hours = chunk.index.values.astype('datetime64[h]').astype('int64')
+    offset = hours - hours[group_starts][group]
+
+    chunk['hour'] = chunk.index.hour
+    chunk['day_of_week'] = chunk.index.dayofweek
+    chunk['month'] = chunk.index.month
+    chunk['is_weekend'] = chunk.index.dayofweek.isin([5, 6]).astype(int)
+
+    # Each meter gets ROLLING_WINDOW empty slots followed by one slot per hour it spans
+    pad = ROLLING_WINDOW
+    spans = np.maximum.reduceat(offset, group_starts) + 1 if n else np.zeros(0, dtype=np.int64)
+    bases = np.cumsum(spans + pad) - spans
+    slots = bases[group] + offset
+    grid = np.full(int(bases[-1] + spans[-1]) if n else 0, np.nan)
+    grid[slots] = values
+
+    for lag in LAGS:
+        lagged = grid[np.maximum(slots - lag, 0)] if n else np.zeros(0)
+        chunk[f'consumption_lag{lag}'] = np.where(offset >= lag, lagged, np.nan)
+
+    history = pd.Series(grid).shift(1).rolling(ROLLING_WINDOW)
+    chunk['consumption_rolling_mean_24h'] = history.mean().to_numpy()[slots]
+    chunk['consumption_rolling_std_24h'] = history.std().to_numpy()[slots]
+
+    chunk['power_factor'] = chunk['consumption_lag1'] / (
+        chunk['z_Avg Voltage (Volt)'] * chunk['z_Avg Current (Amp)'] + 1e-6)
+    return chunk
+
+
+def prepare_features(df):
+    """Feature frame of hourly rows for a whole dataset of readings, sorted by meter and time"""
+    hourly = hourly_readings(df)
+    order, group_starts = meter_order(hourly)
+    return add_features(hourly.iloc[order], group_starts)
+
+
+def feature_chunks(hourly, chunk_rows=DEFAULT_CHUNK_ROWS):
+    """Feature frames for whole meters at a time from hourly_readings() output"""
+    order, group_starts = meter_order(hourly)
+    for start, end in _meter_chunks(group_starts, len(hourly), chunk_rows):
+        chunk_starts = group_starts[(group_starts >= start) & (group_starts < end)] - start
+        yield add_features(hourly.iloc[order[start:end]], chunk_starts)
+
+
+def build_training_sets(chunks, feature_cols, sample_fraction=None, random_state=42):
+    """Hourly regression rows and per (meter, date) classification rows
+
+    `chunks` are hourly feature frames covering whole meters, e.g. from
+    feature_chunks() or a FeatureStore. Rows are down-sampled only after the
+    features exist so lags stay intact. Daily totals sum every hour of the day,
+    and daily features are the means of that day's complete feature rows.
+    """
+    rng = np.random.default_rng(random_state)
+    hourly_parts = []
+    daily_parts = []
+
+    for chunk in chunks:
+        meters = chunk['meter'].astype(str) if 'meter' in chunk.columns else pd.Series('all', index=chunk.index)
+        dates = pd.Series(chunk.index.normalize(), index=chunk.index)
+
+        totals = chunk['t_kWh'].groupby([meters.values, dates.values]).sum()
+        complete = chunk[feature_cols].notna().all(axis=1).to_numpy() & chunk['t_kWh'].notna().to_numpy()
+        means = chunk.loc[complete, feature_cols].groupby(
+            [meters.values[complete], dates.values[complete]]).mean()
+        daily_parts.append(means.join(totals.rename('t_kWh'), how='inner'))
+
+        rows = chunk.loc[complete, feature_cols + ['t_kWh']].assign(meter=meters.values[complete])
+        if sample_fraction is not None and sample_fraction < 1:
+            rows = rows[rng.random(len(rows)) < sample_fraction]
+        hourly_parts.append(rows)
+
+    hourly = pd.concat(hourly_parts) if hourly_parts else pd.DataFrame(columns=feature_cols + ['t_kWh', 'meter'])
+    daily = pd.concat(daily_parts) if daily_parts else pd.DataFrame(columns=feature_cols + ['t_kWh'])
+    return hourly, daily
@@ -0,0 +1,142 @@
+import copy
+import numpy as np
+
+# Trees compare float32 features against float64 thresholds, like sklearn
+INPUT_DTYPE = np.float32
+LEAF = -1
+
+# Rows probed when checking an export against its sklearn forest
+PARITY_ROWS = 256
+
+
+class FlatForest:
+    """A fitted sklearn random forest as flat node arrays with vectorized traversal
+
+    Node ids of every tree are offset into one set of arrays (feature,
+    threshold, left, right, value), so a small batch walks all trees at once
+    with a handful of NumPy ops per depth level and no per-call sklearn
+    overhead. Tree outputs are summed in estimator order and then divided, as
+    RandomForestRegressor/Classifier do, so results match sklearn exactly.
+    """
+
+    def __init__(self, feature, threshold, left, right, missing_left, value, roots,
+                 max_depth, classes=None):
+        self.feature = feature
+        self.threshold = threshold
+        self.left = left
+        self.right = right
+        self.missing_left = missing_left
+        self.value = value
+        self.roots = roots
+        self.max_depth = max_depth
+        self.classes = classes
+
+    @classmethod
+    def from_sklearn(cls, forest):
+        """Export a RandomForestRegressor or RandomForestClassifier"""
+        features, thresholds, lefts, rights, missing, values, roots = [], [], [], [], [], [], []
+        offset = 0
+        max_depth = 0
+        for estimator in forest.estimators_:
+            tree = estimator.tree_
+            is_leaf = tree.children_left == LEAF
+            features.append(np.where(is_leaf, 0, tree.feature).astype(np.intp))
+            thresholds.append(tree.threshold.astype(np.float64))
+            # Leaves point at themselves so traversal can run a fixed number of steps
+            own = np.arange(tree.node_count) + offset
+            lefts.append(np.where(is_leaf, own, tree.children_left + offset))
+            rights.append(np.where(is_leaf, own, tree.children_right + offset))
+            if hasattr(tree, 'missing_go_to_left'):
+                missing.append(np.asarray(tree.missing_go_to_left, dtype=bool))
+            else:
+                missing.append(np.zeros(tree.node_count, dtype=bool))
+            values.append(tree.value[:, 0, :])
+            roots.append(offset)
+            offset += tree.node_count
+            max_depth = max(max_depth, tree.max_depth)
+
+        value = np.concatenate(values)
+        classes = getattr(forest, 'classes_', None)
+        if classes is None:
+            value = value[:, 0]
+        return cls(np.concatenate(features), np.concatenate(thresholds), np.concatenate(lefts),
+                   np.concatenate(rights), np.concatenate(missing), value,
+                   np.asarray(roots, dtype=np.intp), max_depth, classes)
+
+    @property
+    def n_trees(self):
+        return len(self.roots)
+
+    def apply(self, X):
+        """Leaf node id reached in every tree, shape (samples, trees)"""
+        X = np.asarray(X.to_numpy() if hasattr(X, 'to_numpy') else X, dtype=INPUT_DTYPE)
+        rows = np.arange(len(X))[:, None]
+        nodes = np.broadcast_to(self.roots, (len(X), self.n_trees)).copy()
+        for _ in range(self.max_depth):
+            x = X[rows, self.feature[nodes]]
+            go_left = np.where(np.isnan(x), self.missing_left[nodes], x <= self.threshold[nodes])
+            next_nodes = np.where(go_left, self.left[nodes], self.right[nodes])
+            if np.array_equal(next_nodes, nodes):
+                # Every sample has reached a leaf in every tree
+                break
+            nodes = next_nodes
+        return nodes
+
+    def tree_outputs(self, X):
+        """Per-tree predictions, shape (samples, trees) or (samples, trees, classes)"""
+        return self.value[self.apply(X)]
+
+    def _average(self, outputs):
+        total = np.zeros(outputs.shape[:1] + outputs.shape[2:])
+        for t in range(self.n_trees):
+            total += outputs[:, t]
+        total /= self.n_trees
+        return total
+
+    def predict_proba(self, X):
+        return self._average(self.tree_outputs(X))
+
+    def predict_with_trees(self, X):
+        """Regression prediction together with the per-tree outputs it averages"""
+        outputs = self.tree_outputs(X)
+        return self._average(outputs), outputs
+
+    def predict(self, X):
+        if self.classes is None:
+            return self._average(self.tree_outputs(X))
+        return self.classes.take(np.argmax(self.predict_proba(X), axis=1), axis=0)
+
+    def verify(self, forest, X=None, rows=PARITY_ROWS, seed=0):
+        """Check predictions against the sklearn forest this was exported from
+
+        Probes `X`, or rows drawn at and around the forest's split thresholds
+        when not given, and raises ValueError on any mismatch. Returns self.
+        sklearn sums tree outputs in completion order when predicting across
+        threads, so the reference is a single-threaded copy that sums them in
+        estimator order like the flat arrays do.
+        """
+        reference = copy.copy(forest)
+        reference.n_jobs = 1
+        if X is None:
+            X = self._probe_rows(forest.n_features_in_, rows, seed)
+        X = np.asarray(X.to_numpy() if hasattr(X, 'to_numpy') else X, dtype=INPUT_DTYPE)
+        checks = [('predict', self.predict(X), reference.predict(X))]
+        if self.classes is not None:
+            checks.append(('predict_proba', self.predict_proba(X), reference.predict_proba(X)))
+        for name, flat, expected in checks:
+            if not np.array_equal(flat, expected):
+                mismatched = int(np.sum(np.any((flat != expected).reshape(len(X), -1), axis=1)))
+                raise ValueError(f"FlatForest.{name} differs from sklearn on {mismatched} of {len(X)} rows")
+        return self
+
+    def _probe_rows(self, n_features, rows, seed):
+        """Random rows whose values sit on or just beside the split thresholds"""
+        rng = np.random.default_rng(seed)
+        X = rng.standard_normal((rows, n_features))
+        is_split = self.left != np.arange(len(self.left))
+        for f in range(n_features):
+            thresholds = self.threshold[is_split & (self.feature == f)]
+            if len(thresholds):
+                picks = rng.choice(thresholds, rows)
+                X[:, f] = picks + rng.choice([-1e-3, 0.0, 1e-3], rows) * np.maximum(np.abs(picks), 1)
+        return X
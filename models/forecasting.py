@@ -0,0 +1,134 @@
+import numpy as np
+import pandas as pd
+
+HISTORY_HOURS = 168
+HOUR = np.timedelta64(1, 'h')
+
+EXOGENOUS_COLUMNS = ['z_Avg Voltage (Volt)', 'z_Avg Current (Amp)', 'y_Freq (Hz)']
+
+
+def build_history(hourly, hours=HISTORY_HOURS):
+    """Last `hours` hourly kWh sums per meter as a (meters x hours) matrix
+
+    `hourly` has meter, x_Timestamp and t_kWh columns, e.g. the hourly rollup;
+    rows falling in the same hour are summed, so finer readings give the same
+    hourly totals the models are trained on. Missing hours are forward-filled
+    along each meter's row and leading gaps take the meter's mean. Voltage, current and frequency are summarised by their recent means
+    and held constant over the forecast horizon.
+    """
+    hourly = hourly[hourly['t_kWh'].notna()]
+    meters = hourly['meter'].astype(str).to_numpy()
+    timestamps = hourly['x_Timestamp'].to_numpy().astype('datetime64[h]')
+
+    labels, codes = np.unique(meters, return_inverse=True)
+    last = np.full(len(labels), np.datetime64('NaT'), dtype='datetime64[h]')
+    np.maximum.at(last.view('int64'), codes, timestamps.view('int64'))
+
+    slot = (timestamps - last[codes]).astype('int64') + hours - 1
+    recent = slot >= 0
+    kwh = np.zeros((len(labels), hours))
+    counts = np.zeros((len(labels), hours), dtype=np.int64)
+    np.add.at(kwh, (codes[recent], slot[recent]), hourly['t_kWh'].to_numpy(dtype='float64')[recent])
+    np.add.at(counts, (codes[recent], slot[recent]), 1)
+    kwh[counts == 0] = np.nan
+    kwh = pd.DataFrame(kwh).ffill(axis=1).to_numpy()
+    # Every row ends in the meter's last reading, so only leading slots can still be empty
+    kwh = np.where(np.isnan(kwh), np.nanmean(kwh, axis=1)[:, None], kwh)
+
+    exogenous = {}
+    for col in EXOGENOUS_COLUMNS:
+        values = hourly[col].to_numpy(dtype='float64')[recent] if col in hourly.columns else np.zeros(recent.sum())
+        valid = ~np.isnan(values)
+        sums = np.bincount(codes[recent][valid], weights=values[valid], minlength=len(labels))
+        counts = np.bincount(codes[recent][valid], minlength=len(labels))
+        exogenous[col] = np.divide(sums, counts, out=np.zeros(len(labels)), where=counts > 0)
+
+    return {
+        'meters': labels,
+        'last_timestamp': last,
+        'kwh': kwh,
+        'exogenous': exogenous
+    }
+
+
+def subset_history(history, mask):
+    """History of only the meters selected by a boolean mask"""
+    return {
+        'meters': history['meters'][mask],
+        'last_timestamp': history['last_timestamp'][mask],
+        'kwh': history['kwh'][mask],
+        'exogenous': {col: values[mask] for col, values in history['exogenous'].items()}
+    }
+
+
+def step_features(buffer, timestamps, exogenous, feature_cols):
+    """Feature matrix for the next step of every meter, in the model's column order"""
+    index = pd.DatetimeIndex(timestamps)
+    recent = buffer[:, -24:]
+    voltage = exogenous['z_Avg Voltage (Volt)']
+    current = exogenous['z_Avg Current (Amp)']
+    features = {
+        'hour': index.hour.to_numpy(),
+        'day_of_week': index.dayofweek.to_numpy(),
+        'month': index.month.to_numpy(),
+        'is_weekend': index.dayofweek.isin([5, 6]).astype(int),
+        'consumption_lag1': buffer[:, -1],
+        'consumption_lag24': buffer[:, -24],
+        'consumption_lag168': buffer[:, -168],
+        'consumption_rolling_mean_24h': recent.mean(axis=1),
+        'consumption_rolling_std_24h': recent.std(axis=1, ddof=1),
+        'z_Avg Voltage (Volt)': voltage,
+        'z_Avg Current (Amp)': current,
+        'y_Freq (Hz)': exogenous['y_Freq (Hz)'],
+        'power_factor': buffer[:, -1] / (voltage * current + 1e-6)
+    }
+    return pd.DataFrame({col: features[col] for col in feature_cols})
+
+
+def recursive_forecast(model, history, steps, feature_cols, predict=None):
+    """Roll the one-step model forward `steps` hours for all meters at once
+
+    Each step is a single batched predict over the whole fleet; its output is
+    fed back as the newest lag. Returns a (meters x steps) array.
+    """
+    predict = predict or model.predict
+    predictions = np.empty((len(history['meters']), steps))
+    buffer = history['kwh'].copy()
+    for step in range(steps):
+        timestamps = history['last_timestamp'] + (step + 1) * HOUR
+        X = step_features(buffer, timestamps, history['exogenous'], feature_cols)
+        predictions[:, step] = predict(X)
+        buffer = np.concatenate([buffer[:, 1:], predictions[:, step:step + 1]], axis=1)
+    return predictions
+
+
+def recursive_forecast_trees(flat, history, steps, feature_cols):
+    """Recursive forecast through a FlatForest that also keeps every tree's output
+
+    The forest mean is fed back as the next lag, as in recursive_forecast().
+    Returns the (meters x steps) point forecast and a (meters x trees x steps)
+    array of per-tree predictions along the same path.
+    """
+    predictions = np.empty((len(history['meters']), steps))
+    per_tree = np.empty((len(history['meters']), flat.n_trees, steps))
+    buffer = history['kwh'].copy()
+    for step in range(steps):
+        timestamps = history['last_timestamp'] + (step + 1) * HOUR
+        X = step_features(buffer, timestamps, history['exogenous'], feature_cols)
+        predictions[:, step], per_tree[:, :, step] = flat.predict_with_trees(X)
+        buffer = np.concatenate([buffer[:, 1:], predictions[:, step:step + 1]], axis=1)
+    return predictions, per_tree
+
+
+def daily_quantiles(per_tree, days, quantiles):
+    """Quantiles of the per-tree daily totals, taken along the tree axis in one call
+
+    Returns a (quantiles x meters x days) array.
+    """
+    totals = per_tree[:, :, :days * 24].reshape(per_tree.shape[0], per_tree.shape[1], days, 24).sum(axis=3)
+    return np.quantile(totals, quantiles, axis=1)
+
+
+def daily_totals(predictions, days):
+    """Sum hourly predictions into consecutive 24-hour blocks"""
+    return predictions[:, :days * 24].reshape(len(predictions), days, 24).sum(axis=2)
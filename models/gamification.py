@@ -1,10 +1,20 @@
-import sqlite3
 import pandas as pd
 from datetime import datetime, timedelta
 import numpy as np
+from models.badges import classify_consumption
+from models.db import get_connection, transaction
+from models.migrations import migrate
+
+# Shortest time between two refreshes of a leaderboard that has been marked dirty
+LEADERBOARD_REFRESH_SECONDS = 60
+# Past this share of users marked dirty, a refresh rebuilds the whole week instead
+MAX_DIRTY_USER_FRACTION = 0.25
+# Points as before: max(0, int((10 - avg) * 10))
+POINTS_SQL = 'MAX(0, CAST((10 - avg_consumption) * 10 AS INTEGER))'
 
 class GamificationEngine:
-    def __init__(self):
+    def __init__(self, leaderboard_refresh_seconds=LEADERBOARD_REFRESH_SECONDS):
+        self.leaderboard_refresh_seconds = leaderboard_refresh_seconds
         self.badges = {
             0: {'name': 'Eco Saver', 'emoji': '🌱', 'description': 'Using less than 2 kWh/day', 'color': '#4CAF50'},
             1: {'name': 'Green User', 'emoji': '🌍', 'description': 'Using 2-5 kWh/day efficiently', 'color': '#2196F3'},
@@ -15,37 +25,7 @@ class GamificationEngine:
     
     def init_gamification_db(self):
         """Initialize gamification database tables"""
-        conn = sqlite3.connect('energy_app.db')
-        cursor = conn.cursor()
-        
-        # User badges table
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS user_badges (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                user_id INTEGER,
-                badge_type INTEGER,
-                earned_date DATE,
-                daily_consumption REAL,
-                FOREIGN KEY (user_id) REFERENCES users (id)
-            )
-        ''')
-        
-        # Leaderboard table
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS leaderboard (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                user_id INTEGER,
-                week_start DATE,
-                avg_daily_consumption REAL,
-                avg_daily_emissions REAL,
-                total_points INTEGER,
-                rank_position INTEGER,
-                FOREIGN KEY (user_id) REFERENCES users (id)
-            )
-        ''')
-        
-        conn.commit()
-        conn.close()
+        migrate()
     
     def calculate_daily_consumption(self, user_id, date=None):
         """Calculate daily consumption for a user"""
@@ -65,14 +45,59 @@ class GamificationEngine:
     
     def determine_badge(self, daily_consumption):
         """Determine badge based on daily consumption"""
-        if daily_consumption < 2:
-            return 0  # Eco Saver
-        elif daily_consumption < 5:
-            return 1  # Green User
-        elif daily_consumption < 8:
-            return 2  # Carbon Heavy
-        else:
-            return 3  # Efficient Hero
+        return int(classify_consumption(daily_consumption))
+    
+    def simulate_daily_consumption(self, user_ids, dates):
+        """Vectorized calculate_daily_consumption for aligned arrays of user ids and dates
+
+        Draws one value per distinct seed (user_id + day of month), reseeding a
+        single generator rather than constructing one per seed.
+        """
+        user_ids = np.asarray(user_ids, dtype='int64')
+        dates = pd.DatetimeIndex(dates)
+        seeds = user_ids + dates.day.to_numpy()
+        unique_seeds, inverse = np.unique(seeds, return_inverse=True)
+        generator = np.random.RandomState()
+        draws = np.empty(len(unique_seeds))
+        for i, seed in enumerate(unique_seeds):
+            generator.seed(seed)
+            draws[i] = generator.uniform(1.5, 8.0)
+        consumption = draws[inverse]
+        consumption = np.where(dates.weekday.isin([5, 6]), consumption * 1.2, consumption)
+        return np.round(consumption, 2)
+    
+    def assign_badges_batch(self, start_date, end_date=None, user_ids=None):
+        """Assign badges for every user and every day in a date range in one call
+
+        Consumption and badge types are computed as whole arrays and written
+        with a single executemany in one transaction. Returns the rows written.
+        """
+        end_date = end_date or start_date
+        if user_ids is None:
+            user_ids = [user_id for user_id, in get_connection().execute('SELECT id FROM users')]
+        
+        days = pd.date_range(start_date, end_date, freq='D')
+        users = np.repeat(np.asarray(user_ids, dtype='int64'), len(days))
+        dates = np.tile(days.values, len(user_ids))
+        consumption = self.simulate_daily_consumption(users, dates)
+        badge_types = classify_consumption(consumption)
+        
+        assignments = pd.DataFrame({
+            'user_id': users,
+            'earned_date': pd.DatetimeIndex(dates).strftime('%Y-%m-%d'),
+            'badge_type': badge_types,
+            'daily_consumption': consumption
+        })
+        with transaction() as conn:
+            cursor = conn.cursor()
+            cursor.executemany('''INSERT OR REPLACE INTO user_badges 
+                            (user_id, badge_type, earned_date, daily_consumption) 
+                            VALUES (?, ?, ?, ?)''',
+                          zip(assignments['user_id'].tolist(), assignments['badge_type'].tolist(),
+                              assignments['earned_date'].tolist(), assignments['daily_consumption'].tolist()))
+            self.mark_leaderboard_dirty(cursor, sorted({self.week_start(day) for day in days.date}), user_ids)
+        
+        return assignments
     
     def update_user_badge(self, user_id, date=None):
         """Update user's badge for a given date"""
@@ -82,16 +107,13 @@ class GamificationEngine:
         daily_consumption = self.calculate_daily_consumption(user_id, date)
         badge_type = self.determine_badge(daily_consumption)
         
-        conn = sqlite3.connect('energy_app.db')
-        cursor = conn.cursor()
-        
-        cursor.execute('''INSERT OR REPLACE INTO user_badges 
-                        (user_id, badge_type, earned_date, daily_consumption) 
-                        VALUES (?, ?, ?, ?)''',
-                      (user_id, badge_type, date, daily_consumption))
-        
-        conn.commit()
-        conn.close()
+        with transaction() as conn:
+            cursor = conn.cursor()
+            cursor.execute('''INSERT OR REPLACE INTO user_badges 
+                            (user_id, badge_type, earned_date, daily_consumption) 
+                            VALUES (?, ?, ?, ?)''',
+                          (user_id, badge_type, date, daily_consumption))
+            self.mark_leaderboard_dirty(cursor, [self.week_start(date)], [user_id])
         
         return badge_type
     
@@ -100,14 +122,13 @@ class GamificationEngine:
         if date is None:
             date = datetime.now().date()
         
-        conn = sqlite3.connect('energy_app.db')
+        conn = get_connection()
         cursor = conn.cursor()
         
         cursor.execute('''SELECT badge_type FROM user_badges 
                          WHERE user_id = ? AND earned_date = ?''', 
                       (user_id, date))
         result = cursor.fetchone()
-        conn.close()
         
         if result:
             badge_type = result[0]
@@ -125,7 +146,7 @@ class GamificationEngine:
     
     def get_user_badges_history(self, user_id, days=30):
         """Get user's badge history"""
-        conn = sqlite3.connect('energy_app.db')
+        conn = get_connection()
         cursor = conn.cursor()
         
         end_date = datetime.now().date()
@@ -138,7 +159,6 @@ class GamificationEngine:
                       (user_id, start_date, end_date))
         
         results = cursor.fetchall()
-        conn.close()
         
         badges_history = []
         for date, badge_type, consumption in results:
@@ -155,7 +175,7 @@ class GamificationEngine:
         current_badge = self.get_user_badge(user_id)
         
         # Get last 7 days consumption
-        conn = sqlite3.connect('energy_app.db')
+        conn = get_connection()
         cursor = conn.cursor()
         
         end_date = datetime.now().date()
@@ -167,7 +187,6 @@ class GamificationEngine:
                       (user_id, start_date, end_date))
         
         result = cursor.fetchone()
-        conn.close()
         
         avg_consumption = result[0] if result[0] else 5.0
         
@@ -193,65 +212,196 @@ class GamificationEngine:
             'next_goal': next_goal
         }
     
-    def update_leaderboard(self):
-        """Update weekly leaderboard"""
-        conn = sqlite3.connect('energy_app.db')
-        cursor = conn.cursor()
-        
-        # Get current week start (Monday)
-        today = datetime.now().date()
-        week_start = today - timedelta(days=today.weekday())
-        
-        # Get all users
-        cursor.execute('SELECT id FROM users')
-        users = cursor.fetchall()
-        
-        leaderboard_data = []
-        
-        for user_id, in users:
-            # Calculate weekly average
-            cursor.execute('''SELECT AVG(daily_consumption) 
-                            FROM user_badges 
-                            WHERE user_id = ? AND earned_date >= ?''', 
-                          (user_id, week_start))
-            
-            result = cursor.fetchone()
-            avg_consumption = result[0] if result[0] else self.calculate_daily_consumption(user_id)
-            avg_emissions = avg_consumption * 0.82
-            
-            # Calculate points (lower consumption = higher points)
-            points = max(0, int((10 - avg_consumption) * 10))
-            
-            leaderboard_data.append({
-                'user_id': user_id,
-                'avg_consumption': avg_consumption,
-                'avg_emissions': avg_emissions,
-                'points': points
-            })
-        
-        # Sort by points (descending) and assign ranks
-        leaderboard_data.sort(key=lambda x: x['points'], reverse=True)
+    def week_start(self, date):
+        """Monday of the week containing `date`, as stored in the leaderboard tables"""
+        return (date - timedelta(days=date.weekday())).isoformat()
+    
+    def mark_leaderboard_dirty(self, cursor, week_starts, user_ids):
+        """Flag weeks and users whose leaderboard rows are out of date, inside the caller's transaction
+
+        Only this week's leaderboard is kept current, so users are recorded for
+        it alone, whenever the writes reach into it: a week's averages cover
+        every badge from its Monday on. Other weeks are rebuilt in full.
+        """
+        current = self.week_start(datetime.now().date())
+        week_starts = set(week_starts)
+        if week_starts and max(week_starts) >= current:
+            week_starts.add(current)
+            cursor.executemany('INSERT OR IGNORE INTO leaderboard_dirty_users (week_start, user_id) VALUES (?, ?)',
+                               [(current, int(user_id)) for user_id in user_ids])
+        cursor.executemany('''INSERT INTO leaderboard_state (week_start, dirty) VALUES (?, 1)
+                            ON CONFLICT (week_start) DO UPDATE SET dirty = 1''',
+                           [(week_start,) for week_start in sorted(week_starts)])
+    
+    def _leaderboard_refresh(self, cursor, week_start, now):
+        """How the week's leaderboard needs refreshing: 'rebuild', 'update' or None
+
+        A missing leaderboard, or one rebuilt on an earlier day, is rebuilt in
+        full; one marked dirty is updated once the refresh interval has passed.
+        """
+        cursor.execute('SELECT dirty, rebuilt_at, updated_at FROM leaderboard_state WHERE week_start = ?',
+                       (week_start,))
+        state = cursor.fetchone()
+        if state is None or state[1] is None:
+            return 'rebuild'
+        dirty, rebuilt_at, updated_at = state
+        # Users without readings are scored on a simulated value that changes daily
+        if datetime.fromisoformat(rebuilt_at).date() != now.date():
+            return 'rebuild'
+        updated_at = datetime.fromisoformat(updated_at or rebuilt_at)
+        if dirty and (now - updated_at).total_seconds() >= self.leaderboard_refresh_seconds:
+            return 'update'
+        return None
+    
+    def _simulate_missing_scores(self, cursor, today):
+        """Give users in the scores temp table with no consumption this week today's simulated value"""
+        cursor.execute('SELECT user_id FROM temp.leaderboard_scores WHERE avg_consumption IS NULL')
+        missing = [user_id for user_id, in cursor.fetchall()]
+        if missing:
+            consumption = self.simulate_daily_consumption(missing, [today] * len(missing))
+            cursor.executemany('UPDATE temp.leaderboard_scores SET avg_consumption = ? WHERE user_id = ?',
+                               zip(consumption.tolist(), missing))
+    
+    def _mark_leaderboard_refreshed(self, cursor, week_start, rebuilt):
+        """Clear the week's dirty flags and record when it was refreshed"""
+        now = datetime.now().isoformat()
+        cursor.execute('DELETE FROM leaderboard_dirty_users WHERE week_start <= ?', (week_start,))
+        cursor.execute('''INSERT INTO leaderboard_state (week_start, dirty, rebuilt_at, updated_at)
+                        VALUES (?, 0, ?, ?)
+                        ON CONFLICT (week_start) DO UPDATE SET
+                            dirty = 0, updated_at = excluded.updated_at,
+                            rebuilt_at = COALESCE(excluded.rebuilt_at, rebuilt_at)''',
+                       (week_start, now if rebuilt else None, now))
+    
+    def _rebuild_leaderboard(self, cursor, today, week_start):
+        """Recompute a week's leaderboard with set-based SQL, inside the caller's transaction
+
+        Weekly averages are aggregated with one GROUP BY over user_badges into a
+        temp table, where users with no consumption this week get today's
+        simulated value. A single INSERT ... SELECT then scores and ranks every
+        user with ROW_NUMBER().
+        """
+        cursor.execute('''CREATE TEMP TABLE IF NOT EXISTS leaderboard_scores
+                        (user_id INTEGER PRIMARY KEY, avg_consumption REAL)''')
+        cursor.execute('DELETE FROM temp.leaderboard_scores')
+        cursor.execute('''INSERT INTO temp.leaderboard_scores
+                        SELECT u.id, NULLIF(w.avg_consumption, 0)
+                        FROM users u
+                        LEFT JOIN (SELECT user_id, AVG(daily_consumption) AS avg_consumption
+                                   -- Range scan of this week on the covering date index
+                                   FROM user_badges INDEXED BY idx_user_badges_date
+                                   WHERE earned_date >= ?
+                                   GROUP BY user_id) w ON w.user_id = u.id''', (week_start,))
+        self._simulate_missing_scores(cursor, today)
         
-        # Clear existing leaderboard for this week
         cursor.execute('DELETE FROM leaderboard WHERE week_start = ?', (week_start,))
+        # Ties go to the lower user id
+        cursor.execute(f'''INSERT INTO leaderboard 
+                        (user_id, week_start, avg_daily_consumption, 
+                         avg_daily_emissions, total_points, rank_position)
+                        SELECT user_id, ?, avg_consumption, avg_consumption * 0.82, points,
+                               ROW_NUMBER() OVER (ORDER BY points DESC, user_id)
+                        FROM (SELECT user_id, avg_consumption, {POINTS_SQL} AS points
+                              FROM temp.leaderboard_scores)''', (week_start,))
+        self._mark_leaderboard_refreshed(cursor, week_start, rebuilt=True)
+    
+    def _update_dirty_users(self, cursor, today, week_start):
+        """Rescore only the week's dirty users and re-rank, inside the caller's transaction
+
+        Each dirty user's average is read through the (user_id, earned_date)
+        index and upserted into their row. Only the band of points between the
+        dirty users' old and new scores can change rank, so just that band is
+        re-ranked, reaching to the bottom when a user is new to the week, and
+        only rows whose position moved are rewritten. Returns False without
+        touching anything when so many users are dirty that a full rebuild is
+        cheaper.
+        """
+        cursor.execute('SELECT COUNT(*) FROM leaderboard_dirty_users WHERE week_start = ?', (week_start,))
+        dirty = cursor.fetchone()[0]
+        cursor.execute('SELECT COUNT(*) FROM users')
+        if dirty > cursor.fetchone()[0] * MAX_DIRTY_USER_FRACTION:
+            return False
+        
+        cursor.execute('''CREATE TEMP TABLE IF NOT EXISTS leaderboard_scores
+                        (user_id INTEGER PRIMARY KEY, avg_consumption REAL)''')
+        cursor.execute('DELETE FROM temp.leaderboard_scores')
+        cursor.execute('''INSERT INTO temp.leaderboard_scores
+                        SELECT d.user_id, NULLIF(AVG(b.daily_consumption), 0)
+                        FROM leaderboard_dirty_users d
+                        JOIN users u ON u.id = d.user_id
+                        LEFT JOIN user_badges b ON b.user_id = d.user_id AND b.earned_date >= d.week_start
+                        WHERE d.week_start = ?
+                        GROUP BY d.user_id''', (week_start,))
+        self._simulate_missing_scores(cursor, today)
+        
+        cursor.execute(f'''SELECT l.total_points, {POINTS_SQL}
+                        FROM temp.leaderboard_scores s
+                        LEFT JOIN leaderboard l ON l.week_start = ? AND l.user_id = s.user_id''', (week_start,))
+        moves = cursor.fetchall()
+        if not moves:
+            self._mark_leaderboard_refreshed(cursor, week_start, rebuilt=False)
+            return True
+        points = [p for move in moves for p in move if p is not None]
+        # A new row pushes every row below it down a place
+        lowest = -1 if any(old is None for old, _ in moves) else min(points)
+        highest = max(points)
+        
+        # WHERE true lets SQLite parse the upsert clause after a SELECT
+        cursor.execute(f'''INSERT INTO leaderboard 
+                        (user_id, week_start, avg_daily_consumption, avg_daily_emissions, total_points)
+                        SELECT user_id, ?, avg_consumption, avg_consumption * 0.82, {POINTS_SQL}
+                        FROM temp.leaderboard_scores WHERE true
+                        ON CONFLICT (week_start, user_id) DO UPDATE SET
+                            avg_daily_consumption = excluded.avg_daily_consumption,
+                            avg_daily_emissions = excluded.avg_daily_emissions,
+                            total_points = excluded.total_points''', (week_start,))
+        cursor.execute('SELECT COUNT(*) FROM leaderboard WHERE week_start = ? AND total_points > ?',
+                       (week_start, highest))
+        above = cursor.fetchone()[0]
+        cursor.execute('''UPDATE leaderboard SET rank_position = ranked.rank_position
+                        FROM (SELECT id, ? + ROW_NUMBER() OVER (ORDER BY total_points DESC, user_id) AS rank_position
+                              FROM leaderboard INDEXED BY idx_leaderboard_week_points
+                              WHERE week_start = ? AND total_points BETWEEN ? AND ?) ranked
+                        WHERE leaderboard.id = ranked.id
+                          AND leaderboard.rank_position IS NOT ranked.rank_position''',
+                       (above, week_start, lowest, highest))
+        self._mark_leaderboard_refreshed(cursor, week_start, rebuilt=False)
+        return True
+    
+    def refresh_leaderboard(self, force=False):
+        """Bring this week's leaderboard up to date if it is stale; returns whether it changed
+
+        The leaderboard is kept as a materialized table: badge writes mark their
+        week and users dirty, and readers rescore just those users at most once
+        per refresh interval. It is rebuilt in full once a day, when forced, or
+        when too many users are dirty. The staleness check is repeated under the
+        write lock so concurrent viewers do not refresh it twice.
+        """
+        conn = get_connection()
+        cursor = conn.cursor()
         
-        # Insert new leaderboard data
-        for rank, data in enumerate(leaderboard_data, 1):
-            cursor.execute('''INSERT INTO leaderboard 
-                            (user_id, week_start, avg_daily_consumption, 
-                             avg_daily_emissions, total_points, rank_position) 
-                            VALUES (?, ?, ?, ?, ?, ?)''',
-                          (data['user_id'], week_start, data['avg_consumption'],
-                           data['avg_emissions'], data['points'], rank))
-        
-        conn.commit()
-        conn.close()
+        now = datetime.now()
+        week_start = self.week_start(now.date())
+        if not force and self._leaderboard_refresh(cursor, week_start, now) is None:
+            return False
+        
+        with transaction():
+            action = 'rebuild' if force else self._leaderboard_refresh(cursor, week_start, now)
+            if action == 'update' and not self._update_dirty_users(cursor, now.date(), week_start):
+                action = 'rebuild'
+            if action == 'rebuild':
+                self._rebuild_leaderboard(cursor, now.date(), week_start)
+        return action is not None
+    
+    def update_leaderboard(self):
+        """Rebuild this week's leaderboard now"""
+        self.refresh_leaderboard(force=True)
     
     def get_leaderboard(self, limit=10):
         """Get current leaderboard"""
-        self.update_leaderboard()  # Ensure it's up to date
+        self.refresh_leaderboard()  # Rebuild only if badges changed since the last build
         
-        conn = sqlite3.connect('energy_app.db')
+        conn = get_connection()
         cursor = conn.cursor()
         
         today = datetime.now().date()
@@ -266,7 +416,6 @@ class GamificationEngine:
                          LIMIT ?''', (week_start, limit))
         
         results = cursor.fetchall()
-        conn.close()
         
         leaderboard = []
         for username, consumption, emissions, points, rank in results:
@@ -282,7 +431,9 @@ class GamificationEngine:
     
     def get_user_rank(self, user_id):
         """Get user's current rank"""
-        conn = sqlite3.connect('energy_app.db')
+        self.refresh_leaderboard()
+        
+        conn = get_connection()
         cursor = conn.cursor()
         
         today = datetime.now().date()
@@ -294,7 +445,6 @@ class GamificationEngine:
                       (user_id, week_start))
         
         result = cursor.fetchone()
-        conn.close()
         
         if result:
             return {'rank': result[0], 'points': result[1]}
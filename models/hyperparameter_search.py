@@ -0,0 +1,250 @@
+import os
+import time
+import shutil
+import tempfile
+import itertools
+from concurrent.futures import ProcessPoolExecutor, wait
+import numpy as np
+import pandas as pd
+from sklearn.ensemble import RandomForestRegressor, RandomForestClassifier
+from sklearn.metrics import mean_absolute_error, accuracy_score
+
+from models.flat_forest import FlatForest, PARITY_ROWS
+
+SEARCH_SPACE = {
+    'n_estimators': [25, 50, 100, 200],
+    'max_depth': [8, 12, 16, None],
+    'max_features': [1.0, 0.5, 'sqrt']
+}
+DEFAULT_ETA = 3
+DEFAULT_TIME_BUDGET_S = 600
+# Size cap on a candidate's flattened tree arrays, the part the dashboard keeps
+DEFAULT_MAX_MODEL_MB = 256
+# Working set of all concurrent fits together, split evenly across the workers
+DEFAULT_MEMORY_BUDGET_MB = 1024
+# sklearn tree node record, and the flattened copy's arrays per node
+SKLEARN_NODE_BYTES = 64
+FLAT_NODE_BYTES = 41
+HOLDOUT_FRACTION = 0.2
+MIN_RUNG_ROWS = 200
+LATENCY_REPEATS = 30
+
+
+def candidates(space=SEARCH_SPACE):
+    """Every combination of the search space as parameter dicts"""
+    names = list(space)
+    return [dict(zip(names, values)) for values in itertools.product(*(space[name] for name in names))]
+
+
+def time_ordered_holdout(meters):
+    """Flag the last HOLDOUT_FRACTION of each meter's rows (rows sorted by meter and time)"""
+    meters = pd.Series(np.asarray(meters).astype(str))
+    position = meters.groupby(meters.values, sort=False).cumcount().to_numpy()
+    size = meters.groupby(meters.values, sort=False).transform('size').to_numpy()
+    return position >= size * (1 - HOLDOUT_FRACTION)
+
+
+def _flat_bytes(flat):
+    """Memory the dashboard holds for a flattened forest"""
+    return sum(array.nbytes for array in [flat.feature, flat.threshold, flat.left, flat.right,
+                                          flat.missing_left, flat.value])
+
+
+def estimate_fit_mb(params, train_rows, n_features, n_classes=1):
+    """Rough upper bound on a worker's memory for one candidate, in MB
+
+    Counts the float32 training copy with sklearn's per-sample work arrays,
+    and every tree twice (sklearn nodes and the flattened copy), assuming
+    trees grow until each leaf holds one row or the depth limit is reached.
+    """
+    nodes = 2 * train_rows
+    if params['max_depth'] is not None:
+        nodes = min(nodes, 2 ** (params['max_depth'] + 1))
+    data = train_rows * (n_features * 4 + 40)
+    trees = params['n_estimators'] * nodes * (SKLEARN_NODE_BYTES + FLAT_NODE_BYTES + 16 * n_classes)
+    return (data + trees) / 1024 ** 2
+
+
+def _rows_within_budget(params, train_rows, n_features, n_classes, budget_mb):
+    """Largest row count up to `train_rows` whose fit fits in `budget_mb`, halving as needed; 0 if none does"""
+    rows = train_rows
+    while rows >= MIN_RUNG_ROWS:
+        if estimate_fit_mb(params, rows, n_features, n_classes) <= budget_mb:
+            return rows
+        rows //= 2
+    return 0
+
+
+def _terminate(pool):
+    """Shut a process pool down now, killing fits still running past the deadline"""
+    terminate_workers = getattr(pool, 'terminate_workers', None)
+    if terminate_workers is not None:
+        terminate_workers()
+        return
+    # Before Python 3.14 the executor has no public way to stop busy workers
+    processes = list((getattr(pool, '_processes', None) or {}).values())
+    pool.shutdown(wait=False, cancel_futures=True)
+    for process in processes:
+        process.terminate()
+    for process in processes:
+        process.join()
+
+
+def _evaluate(paths, kind, params, train_rows, seed):
+    """Worker: fit a candidate on a subset of the training rows and score it"""
+    X = np.load(paths['X'], mmap_mode='r')
+    y = np.load(paths['y'], mmap_mode='r')
+    holdout = np.load(paths['holdout'], mmap_mode='r')
+    train_index = np.flatnonzero(~holdout)
+    rng = np.random.default_rng(seed)
+    train_index = np.sort(rng.permutation(train_index)[:train_rows])
+    test_index = np.flatnonzero(holdout)
+
+    if kind == 'forecast':
+        model = RandomForestRegressor(**params, random_state=42, n_jobs=1)
+    else:
+        model = RandomForestClassifier(**params, random_state=42, n_jobs=1)
+    began = time.perf_counter()
+    model.fit(X[train_index], y[train_index])
+    fit_seconds = time.perf_counter() - began
+
+    predictions = model.predict(X[test_index])
+    if kind == 'forecast':
+        score = mean_absolute_error(y[test_index], predictions)
+    else:
+        score = accuracy_score(y[test_index], predictions)
+
+    # Dashboard-style latency: one row through the flattened forest
+    flat = FlatForest.from_sklearn(model).verify(model, X[test_index[:PARITY_ROWS]])
+    row = np.asarray(X[test_index[:1]])
+    timings = []
+    for _ in range(LATENCY_REPEATS):
+        began = time.perf_counter()
+        flat.predict(row)
+        timings.append(time.perf_counter() - began)
+
+    return {
+        'score': float(score),
+        'latency_ms': float(np.median(timings) * 1000),
+        'model_mb': _flat_bytes(flat) / 1024 ** 2,
+        'fit_seconds': fit_seconds,
+        'train_rows': len(train_index)
+    }
+
+
+def pareto_front(results, higher_is_better):
+    """Candidates no other candidate beats on both score and latency"""
+    score = results['score'] if higher_is_better else -results['score']
+    keep = []
+    for i in range(len(results)):
+        dominated = ((score >= score.iloc[i]) & (results['latency_ms'] <= results['latency_ms'].iloc[i])
+                     & ((score > score.iloc[i]) | (results['latency_ms'] < results['latency_ms'].iloc[i])))
+        keep.append(not dominated.any())
+    return results[keep].sort_values('latency_ms')
+
+
+def successive_halving(X, y, holdout, kind, space=SEARCH_SPACE, eta=DEFAULT_ETA,
+                       time_budget_s=DEFAULT_TIME_BUDGET_S, memory_budget_mb=DEFAULT_MEMORY_BUDGET_MB,
+                       max_model_mb=DEFAULT_MAX_MODEL_MB, max_latency_ms=None, workers=None):
+    """Successive halving over forest size, depth and feature subsets
+
+    Every rung trains the surviving candidates on eta times more rows than the
+    last, across worker processes sharing memory-mapped arrays, and keeps the
+    best 1/eta by holdout score, plus the accuracy/latency front. Each worker
+    gets an equal share of `memory_budget_mb`: a candidate whose estimated fit
+    would not fit its share is trained on fewer rows, or skipped if even
+    MIN_RUNG_ROWS would not fit. Candidates whose flattened trees exceed
+    `max_model_mb` or whose single-row latency exceeds `max_latency_ms` are
+    dropped. When the wall-clock budget runs out, fits still running are
+    killed and the search reports what finished.
+    """
+    workers = workers or os.cpu_count() or 1
+    higher_is_better = kind == 'badge'
+    deadline = time.perf_counter() + time_budget_s
+    pool_params = candidates(space)
+    n_train = int((~holdout).sum())
+    rungs = max(1, int(np.floor(np.log(len(pool_params)) / np.log(eta))) + 1)
+    rows_per_rung = [max(MIN_RUNG_ROWS, int(n_train / eta ** (rungs - 1 - r))) for r in range(rungs)]
+    n_features = np.shape(X)[1]
+    n_classes = len(np.unique(y)) if kind == 'badge' else 1
+    worker_budget_mb = memory_budget_mb / workers
+
+    tmp_dir = tempfile.mkdtemp(prefix='hyperparameter_search_')
+    paths = {name: os.path.join(tmp_dir, name + '.npy') for name in ['X', 'y', 'holdout']}
+    records = []
+    try:
+        np.save(paths['X'], np.asarray(X, dtype='float32'))
+        np.save(paths['y'], np.asarray(y))
+        np.save(paths['holdout'], np.asarray(holdout, dtype=bool))
+
+        survivors = list(range(len(pool_params)))
+        pool = ProcessPoolExecutor(max_workers=workers)
+        timed_out = False
+        try:
+            for rung, train_rows in enumerate(rows_per_rung):
+                remaining = deadline - time.perf_counter()
+                if remaining <= 0 or not survivors:
+                    break
+                print(f"Rung {rung}: {len(survivors)} {kind} candidates on {min(train_rows, n_train)} rows")
+                futures = {}
+                fit_rows = {}
+                for i in survivors:
+                    rows = _rows_within_budget(pool_params[i], min(train_rows, n_train), n_features,
+                                               n_classes, worker_budget_mb)
+                    if rows == 0:
+                        print(f"Skipping {pool_params[i]}: over the {worker_budget_mb:.0f} MB per-worker memory budget")
+                        continue
+                    fit_rows[i] = rows
+                    futures[pool.submit(_evaluate, paths, kind, pool_params[i], rows, rung)] = i
+                done, pending = wait(futures, timeout=remaining)
+                for future in pending:
+                    future.cancel()
+
+                rung_records = []
+                for future in done:
+                    i = futures[future]
+                    record = dict(pool_params[i], candidate=i, rung=rung, **future.result())
+                    record['fit_mb'] = estimate_fit_mb(pool_params[i], fit_rows[i], n_features, n_classes)
+                    record['over_budget'] = bool(
+                        record['model_mb'] > max_model_mb
+                        or (max_latency_ms is not None and record['latency_ms'] > max_latency_ms))
+                    rung_records.append(record)
+                records.extend(rung_records)
+                if pending:
+                    print(f"Time budget reached during rung {rung}")
+                    timed_out = True
+                    break
+
+                eligible = [record for record in rung_records if not record['over_budget']]
+                eligible.sort(key=lambda record: -record['score'] if higher_is_better else record['score'])
+                survivors = [record['candidate'] for record in eligible[:max(1, len(eligible) // eta)]]
+                if eligible:
+                    # Fast candidates on the accuracy/latency front also advance
+                    front = pareto_front(pd.DataFrame(eligible), higher_is_better)
+                    survivors += [int(i) for i in front['candidate'] if int(i) not in survivors]
+        finally:
+            if timed_out:
+                _terminate(pool)
+            else:
+                pool.shutdown(wait=True)
+    finally:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+
+    results = pd.DataFrame(records)
+    if 'max_depth' in results.columns:
+        results['max_depth'] = pd.Series([None if pd.isna(depth) else int(depth) for depth in results['max_depth']],
+                                         index=results.index, dtype=object)
+    if results.empty:
+        return {'best': None, 'front': results, 'results': results}
+
+    # Compare candidates on the most data any of them reached within the budget
+    final = results[(results['rung'] == results['rung'].max()) & ~results['over_budget']]
+    if final.empty:
+        final = results[~results['over_budget']]
+    front = pareto_front(final, higher_is_better) if not final.empty else final
+    if front.empty:
+        best = None
+    else:
+        best_row = front.loc[front['score'].idxmax() if higher_is_better else front['score'].idxmin()]
+        best = pool_params[int(best_row['candidate'])]
+    return {'best': best, 'front': front, 'results': results}
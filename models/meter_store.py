@@ -0,0 +1,165 @@
+import os
+import json
+import shutil
+import numpy as np
+import pandas as pd
+
+DEFAULT_STORE_DIR = 'data/meter_store'
+INDEX_FILE = 'index.json'
+
+NS_PER_DAY = 24 * 3600 * 10 ** 9
+
+
+def meter_order(df):
+    """Row order sorted by (meter, timestamp) and the start of each meter's run"""
+    timestamps = df.index.values
+    if 'meter' in df.columns:
+        codes = df['meter'].astype('category').cat.codes.to_numpy()
+    else:
+        codes = np.zeros(len(df), dtype=np.int64)
+    order = np.lexsort((timestamps, codes))
+    sorted_codes = codes[order]
+    group_starts = np.concatenate([[0], np.flatnonzero(np.diff(sorted_codes)) + 1])
+    return order, group_starts
+
+
+class MeterStore:
+    """Memory-mapped per-meter arrays of timestamps and kWh with an offset index
+
+    Readings appended after the build are kept in a small in-memory delta per
+    meter, so ingestion never rewrites the mapped files.
+    """
+
+    def __init__(self, root):
+        self.root = root
+        with open(os.path.join(root, INDEX_FILE)) as f:
+            index = json.load(f)
+        self.fingerprint = index['fingerprint']
+        self.offsets = {meter: tuple(bounds) for meter, bounds in index['offsets'].items()}
+        self.timestamps = np.load(os.path.join(root, 'timestamps.npy'), mmap_mode='r')
+        self.kwh = np.load(os.path.join(root, 'kwh.npy'), mmap_mode='r')
+        self._deltas = {}
+
+    @classmethod
+    def open(cls, root, fingerprint):
+        """Open an existing store if it was built from data with this fingerprint"""
+        try:
+            store = cls(root)
+        except (OSError, ValueError, KeyError):
+            return None
+        return store if store.fingerprint == fingerprint else None
+
+    @classmethod
+    def build(cls, df, root, fingerprint):
+        """Write readings sorted by (meter, time) so each meter is one contiguous slice"""
+        meters = df['meter'].astype('category')
+        codes = meters.cat.codes.to_numpy()
+        timestamps = df.index.values.astype('datetime64[ns]').view('int64')
+        order, group_starts = meter_order(df)
+
+        ends = np.append(group_starts[1:], len(order))
+        offsets = {}
+        for start, end in zip(group_starts, ends):
+            code = codes[order[start]] if end > start else -1
+            if code >= 0:
+                offsets[str(meters.cat.categories[code])] = [int(start), int(end)]
+
+        build_root = root + '.building'
+        shutil.rmtree(build_root, ignore_errors=True)
+        os.makedirs(build_root)
+        np.save(os.path.join(build_root, 'timestamps.npy'), timestamps[order])
+        np.save(os.path.join(build_root, 'kwh.npy'),
+                df['t_kWh'].to_numpy(dtype='float32')[order])
+        with open(os.path.join(build_root, INDEX_FILE), 'w') as f:
+            json.dump({'fingerprint': fingerprint, 'offsets': offsets}, f)
+
+        shutil.rmtree(root, ignore_errors=True)
+        os.replace(build_root, root)
+        return cls(root)
+
+    def append(self, meters, timestamps, kwh):
+        """Add readings to the per-meter deltas; costs time in the batch size, not the store size"""
+        meters = np.asarray(meters).astype(str)
+        timestamps = np.asarray(timestamps).astype('datetime64[ns]').view('int64')
+        kwh = np.asarray(kwh, dtype='float32')
+        order = np.argsort(meters, kind='stable')
+        labels, starts = np.unique(meters[order], return_index=True)
+        for meter, rows in zip(labels, np.split(order, starts[1:])):
+            self._deltas.setdefault(str(meter), []).append((timestamps[rows], kwh[rows]))
+
+    def _delta(self, meter):
+        """A meter's appended readings as one time-ordered (timestamps, kWh) pair"""
+        parts = self._deltas[meter]
+        if len(parts) > 1 or not np.all(np.diff(parts[0][0]) >= 0):
+            ts = np.concatenate([part[0] for part in parts])
+            kwh = np.concatenate([part[1] for part in parts])
+            order = np.argsort(ts, kind='stable')
+            self._deltas[meter] = parts = [(ts[order], kwh[order])]
+        return parts[0]
+
+    def __contains__(self, meter):
+        return meter in self.offsets or meter in self._deltas
+
+    def last_timestamp(self, meter):
+        last = []
+        if meter in self.offsets:
+            start, end = self.offsets[meter]
+            last.append(self.timestamps[end - 1])
+        if meter in self._deltas:
+            last.append(self._delta(meter)[0][-1])
+        return max(last)
+
+    def _segments(self, meter, start=None, end=None):
+        """(timestamps, kWh) of the mapped slice and of the delta, each between two ns timestamps"""
+        segments = []
+        if meter in self.offsets:
+            lo, hi = self.offsets[meter]
+            segments.append((self.timestamps[lo:hi], self.kwh[lo:hi]))
+        if meter in self._deltas:
+            segments.append(self._delta(meter))
+        result = []
+        for ts, kwh in segments:
+            left = np.searchsorted(ts, start, side='left') if start is not None else 0
+            right = np.searchsorted(ts, end, side='right') if end is not None else len(ts)
+            result.append((ts[left:right], kwh[left:right]))
+        return result
+
+    def window(self, meter, start=None, end=None):
+        """(timestamps, kWh) of one meter between two ns timestamps
+
+        Zero-copy views of the mapped arrays unless the meter has appended readings.
+        """
+        segments = self._segments(meter, start, end)
+        if len(segments) == 1:
+            return segments[0]
+        ts = np.concatenate([segment[0] for segment in segments])
+        kwh = np.concatenate([segment[1] for segment in segments])
+        order = np.argsort(ts, kind='stable')
+        return ts[order], kwh[order]
+
+    def daily_totals(self, meter, days):
+        """Daily kWh totals for the meter's last `days` days of readings"""
+        last_day = self.last_timestamp(meter) // NS_PER_DAY
+        first_day = last_day - days + 1
+        totals = np.zeros(days)
+        for ts, kwh in self._segments(meter, start=first_day * NS_PER_DAY):
+            totals += np.bincount(ts // NS_PER_DAY - first_day, weights=np.nan_to_num(kwh), minlength=days)
+        dates = (np.arange(first_day, last_day + 1) * NS_PER_DAY).astype('datetime64[ns]')
+        return dates, totals
+
+
+def data_fingerprint(df):
+    """Content fingerprint of the readings a store is built from
+
+    Values are canonicalized first (kWh at float32 precision rounded to 4
+    decimals, timestamps in ns) so the same readings loaded from the CSV or
+    the columnar cache fingerprint the same.
+    """
+    kwh = df['t_kWh'].to_numpy(dtype='float32').astype('float64')
+    canonical = pd.DataFrame({
+        'meter': df['meter'].astype('category').to_numpy(),
+        'timestamp': df.index.values.astype('datetime64[ns]').view('int64'),
+        't_kWh': np.round(kwh, 4)
+    })
+    hashed = pd.util.hash_pandas_object(canonical, index=False)
+    return f"{len(df)}-{int(hashed.sum()) & 0xFFFFFFFFFFFFFFFF:016x}"
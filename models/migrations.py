@@ -0,0 +1,102 @@
+from models.db import DB_PATH, get_connection, transaction
+
+# (version, description, statements), applied in order; PRAGMA user_version
+# records the last one applied. Never edit a released migration, add a new one.
+MIGRATIONS = [
+    (1, 'base schema', [
+        '''
+        CREATE TABLE IF NOT EXISTS users (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            username TEXT UNIQUE NOT NULL,
+            email TEXT UNIQUE NOT NULL,
+            password_hash TEXT NOT NULL,
+            meter_id TEXT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+        ''',
+        '''
+        CREATE TABLE IF NOT EXISTS user_badges (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER,
+            badge_type INTEGER,
+            earned_date DATE,
+            daily_consumption REAL,
+            FOREIGN KEY (user_id) REFERENCES users (id)
+        )
+        ''',
+        '''
+        CREATE TABLE IF NOT EXISTS leaderboard (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER,
+            week_start DATE,
+            avg_daily_consumption REAL,
+            avg_daily_emissions REAL,
+            total_points INTEGER,
+            rank_position INTEGER,
+            FOREIGN KEY (user_id) REFERENCES users (id)
+        )
+        ''',
+        '''
+        CREATE TABLE IF NOT EXISTS leaderboard_state (
+            week_start DATE PRIMARY KEY,
+            dirty INTEGER NOT NULL DEFAULT 1,
+            rebuilt_at TIMESTAMP
+        )
+        ''',
+        'CREATE INDEX IF NOT EXISTS idx_leaderboard_week_rank ON leaderboard (week_start, rank_position)'
+    ]),
+    (2, 'one badge per user and day, one leaderboard row per user and week', [
+        # Keep the most recently written row of each duplicate group
+        '''DELETE FROM user_badges WHERE id NOT IN
+           (SELECT MAX(id) FROM user_badges GROUP BY user_id, earned_date)''',
+        'CREATE UNIQUE INDEX idx_user_badges_user_date ON user_badges (user_id, earned_date)',
+        # Covers the weekly aggregate of the leaderboard rebuild
+        'CREATE INDEX idx_user_badges_date ON user_badges (earned_date, user_id, daily_consumption)',
+        '''DELETE FROM leaderboard WHERE id NOT IN
+           (SELECT MAX(id) FROM leaderboard GROUP BY week_start, user_id)''',
+        'CREATE UNIQUE INDEX idx_leaderboard_week_user ON leaderboard (week_start, user_id)',
+        'UPDATE leaderboard_state SET dirty = 1'
+    ]),
+    (3, 'per-user leaderboard refreshes', [
+        # Users whose badges changed since their week's leaderboard was last refreshed
+        '''
+        CREATE TABLE leaderboard_dirty_users (
+            week_start DATE NOT NULL,
+            user_id INTEGER NOT NULL,
+            PRIMARY KEY (week_start, user_id)
+        ) WITHOUT ROWID
+        ''',
+        # rebuilt_at keeps the last full rebuild, updated_at the last refresh of any kind
+        'ALTER TABLE leaderboard_state ADD COLUMN updated_at TIMESTAMP',
+        # Walks a band of points in rank order when re-ranking a few users
+        'CREATE INDEX idx_leaderboard_week_points ON leaderboard (week_start, total_points DESC, user_id)',
+        'UPDATE leaderboard_state SET updated_at = rebuilt_at'
+    ])
+]
+LATEST_VERSION = MIGRATIONS[-1][0]
+
+
+def schema_version(conn):
+    return conn.execute('PRAGMA user_version').fetchone()[0]
+
+
+def migrate(path=DB_PATH):
+    """Apply every pending migration in one transaction and return the schema version
+
+    The version is read again under the write lock, so processes starting
+    together apply each migration once.
+    """
+    conn = get_connection(path)
+    if schema_version(conn) >= LATEST_VERSION:
+        return schema_version(conn)
+
+    with transaction(path):
+        version = schema_version(conn)
+        for number, description, statements in MIGRATIONS:
+            if number <= version:
+                continue
+            for statement in statements:
+                conn.execute(statement)
+            conn.execute(f'PRAGMA user_version = {number}')
+            print(f"Applied database migration {number}: {description}")
+    return schema_version(conn)
@@ -0,0 +1,172 @@
+import numpy as np
+import pandas as pd
+
+DEFAULT_ALPHA = 0.1
+DEFAULT_MIN_SAMPLES = 24
+Z_THRESHOLD = 3.0
+HOURS = 24
+
+
+class OnlineAnomalyDetector:
+    """Streaming anomaly scorer with O(1) state per meter (and per meter-hour)
+
+    Keeps Welford count/mean/M2 per meter and per (meter, hour of day) plus an
+    EWMA per meter in flat arrays. Batches are scored against the state as it
+    was before the batch, then merged in with Chan's parallel update.
+    """
+
+    def __init__(self, alpha=DEFAULT_ALPHA, min_samples=DEFAULT_MIN_SAMPLES,
+                 z_threshold=Z_THRESHOLD, capacity=64):
+        self.alpha = alpha
+        self.min_samples = min_samples
+        self.z_threshold = z_threshold
+        self.meter_ids = []
+        self._index = {}
+        self._allocate(capacity)
+
+    def _allocate(self, capacity):
+        self.count = np.zeros(capacity)
+        self.mean = np.zeros(capacity)
+        self.m2 = np.zeros(capacity)
+        self.ewma = np.full(capacity, np.nan)
+        self.hour_count = np.zeros(capacity * HOURS)
+        self.hour_mean = np.zeros(capacity * HOURS)
+        self.hour_m2 = np.zeros(capacity * HOURS)
+
+    def _grow(self, needed):
+        capacity = len(self.count)
+        if needed <= capacity:
+            return
+        new_capacity = max(needed, capacity * 2)
+        for name in ['count', 'mean', 'm2', 'ewma', 'hour_count', 'hour_mean', 'hour_m2']:
+            old = getattr(self, name)
+            width = HOURS if name.startswith('hour_') else 1
+            fill = np.nan if name == 'ewma' else 0.0
+            grown = np.full(new_capacity * width, fill)
+            grown[:len(old)] = old
+            setattr(self, name, grown)
+
+    def _meter_codes(self, meters):
+        """Stable integer slot per meter id, registering unseen meters"""
+        labels, inverse = np.unique(np.asarray(meters).astype(str), return_inverse=True)
+        slots = np.empty(len(labels), dtype=np.int64)
+        for i, label in enumerate(labels):
+            slot = self._index.get(label)
+            if slot is None:
+                slot = len(self.meter_ids)
+                self._index[label] = slot
+                self.meter_ids.append(label)
+            slots[i] = slot
+        self._grow(len(self.meter_ids))
+        return slots[inverse]
+
+    @staticmethod
+    def _merge(count, mean, m2, keys, values, size):
+        """Chan's parallel update of Welford state with a batch, grouped by key"""
+        n_b = np.bincount(keys, minlength=size).astype(float)
+        touched = n_b > 0
+        sum_b = np.bincount(keys, weights=values, minlength=size)
+        mean_b = np.divide(sum_b, n_b, out=np.zeros(size), where=touched)
+        m2_b = np.bincount(keys, weights=(values - mean_b[keys]) ** 2, minlength=size)
+
+        n = count[:size] + n_b
+        delta = mean_b - mean[:size]
+        ratio = np.divide(n_b, n, out=np.zeros(size), where=touched)
+        mean[:size] += np.where(touched, delta * ratio, 0.0)
+        m2[:size] += np.where(touched, m2_b + delta ** 2 * count[:size] * ratio, 0.0)
+        count[:size] = n
+
+    def _update_ewma(self, slots, values):
+        """EWMA after every reading of the batch, in closed form per meter"""
+        order = np.argsort(slots, kind='stable')
+        slots, values = slots[order], values[order]
+        size = len(self.meter_ids)
+        group_size = np.bincount(slots, minlength=size)
+        starts = np.concatenate([[0], np.cumsum(group_size)[:-1]])
+        position = np.arange(len(slots)) - starts[slots]
+        remaining = group_size[slots] - 1 - position
+
+        decay = 1.0 - self.alpha
+        old = self.ewma[:size].copy()
+        unseen = np.isnan(old) & (group_size > 0)
+        # A meter's first reading seeds its EWMA
+        old[unseen] = values[starts[unseen]]
+        weighted = np.bincount(slots, weights=self.alpha * decay ** remaining * values, minlength=size)
+        touched = group_size > 0
+        self.ewma[:size] = np.where(touched, decay ** group_size * old + weighted, self.ewma[:size])
+
+    def _std(self, count, m2):
+        return np.sqrt(np.divide(m2, count - 1, out=np.full(len(count), np.nan), where=count > 1))
+
+    def update(self, meters, timestamps, values):
+        """Fold a batch of readings into the state without scoring it"""
+        values = np.asarray(values, dtype=float)
+        valid = ~np.isnan(values)
+        if not valid.any():
+            return
+        slots = self._meter_codes(np.asarray(meters)[valid])
+        hours = pd.DatetimeIndex(np.asarray(timestamps)[valid]).hour.to_numpy()
+        # Time order within the batch matters for the EWMA
+        order = np.argsort(np.asarray(timestamps)[valid], kind='stable')
+        slots, hours, values = slots[order], hours[order], values[valid][order]
+
+        size = len(self.meter_ids)
+        self._merge(self.count, self.mean, self.m2, slots, values, size)
+        self._merge(self.hour_count, self.hour_mean, self.hour_m2,
+                    slots * HOURS + hours, values, size * HOURS)
+        self._update_ewma(slots, values)
+
+    def score_batch(self, meters, timestamps, values, update=True):
+        """Score a batch against the current state, then (optionally) learn from it"""
+        meters = np.asarray(meters).astype(str)
+        values = np.asarray(values, dtype=float)
+        slots = self._meter_codes(meters)
+        hours = pd.DatetimeIndex(timestamps).hour.to_numpy()
+        cells = slots * HOURS + hours
+
+        meter_std = self._std(self.count[slots], self.m2[slots])
+        hour_std = self._std(self.hour_count[cells], self.hour_m2[cells])
+        use_hour = (self.hour_count[cells] >= self.min_samples) & (hour_std > 0)
+        baseline = np.where(use_hour, self.hour_mean[cells], self.mean[slots])
+        spread = np.where(use_hour, hour_std, meter_std)
+        enough = self.count[slots] >= self.min_samples
+
+        with np.errstate(divide='ignore', invalid='ignore'):
+            z_score = np.where(enough, (values - baseline) / spread, np.nan)
+            ewma_score = np.where(enough, (values - self.ewma[slots]) / meter_std, np.nan)
+
+        result = pd.DataFrame({
+            'timestamp': pd.DatetimeIndex(timestamps),
+            'meter': meters,
+            'consumption': values,
+            'z_score': z_score,
+            'ewma_score': ewma_score,
+            'is_anomaly': np.abs(z_score) > self.z_threshold
+        })
+        if update:
+            self.update(meters, timestamps, values)
+        return result
+
+    def save(self, path):
+        """Checkpoint the detector state to a .npz file"""
+        size = len(self.meter_ids)
+        np.savez(path,
+                 meter_ids=np.array(self.meter_ids, dtype=str),
+                 params=np.array([self.alpha, self.min_samples, self.z_threshold]),
+                 count=self.count[:size], mean=self.mean[:size], m2=self.m2[:size],
+                 ewma=self.ewma[:size], hour_count=self.hour_count[:size * HOURS],
+                 hour_mean=self.hour_mean[:size * HOURS], hour_m2=self.hour_m2[:size * HOURS])
+
+    @classmethod
+    def load(cls, path):
+        """Restore a detector from a checkpoint written by save()"""
+        with np.load(path) as state:
+            alpha, min_samples, z_threshold = state['params']
+            meter_ids = [str(m) for m in state['meter_ids']]
+            detector = cls(alpha=float(alpha), min_samples=int(min_samples),
+                           z_threshold=float(z_threshold), capacity=max(64, len(meter_ids)))
+            detector.meter_ids = meter_ids
+            detector._index = {meter: i for i, meter in enumerate(meter_ids)}
+            for name in ['count', 'mean', 'm2', 'ewma', 'hour_count', 'hour_mean', 'hour_m2']:
+                getattr(detector, name)[:len(state[name])] = state[name]
+        return detector
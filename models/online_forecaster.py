@@ -0,0 +1,85 @@
+import os
+import joblib
+import numpy as np
+from sklearn.linear_model import SGDRegressor
+from sklearn.preprocessing import StandardScaler
+
+from models.features import FEATURE_COLUMNS
+
+DEFAULT_CHECKPOINT_EVERY = 10
+DEFAULT_ALPHA = 1e-4
+DEFAULT_ETA0 = 0.01
+
+
+class OnlineForecaster:
+    """Consumption forecaster updated with partial_fit on each ingested batch
+
+    A scaler and an SGD linear model are both fitted incrementally, so memory
+    stays constant however many readings arrive. Uses the same feature columns
+    as the forest, and can stand in for it in the recursive fleet forecast.
+    """
+
+    def __init__(self, feature_cols=FEATURE_COLUMNS, checkpoint_path=None,
+                 checkpoint_every=DEFAULT_CHECKPOINT_EVERY, alpha=DEFAULT_ALPHA, eta0=DEFAULT_ETA0):
+        self.feature_cols = list(feature_cols)
+        self.checkpoint_path = checkpoint_path
+        self.checkpoint_every = checkpoint_every
+        self.scaler = StandardScaler()
+        self.model = SGDRegressor(alpha=alpha, eta0=eta0, random_state=42)
+        self.batches_seen = 0
+        self.rows_seen = 0
+
+    @property
+    def is_fitted(self):
+        return self.rows_seen > 0
+
+    def partial_fit(self, features):
+        """Learn from the complete rows of a feature frame"""
+        complete = features[self.feature_cols].notna().all(axis=1) & features['t_kWh'].notna()
+        if not complete.any():
+            return 0
+        X = features.loc[complete, self.feature_cols].to_numpy(dtype='float64')
+        y = features.loc[complete, 't_kWh'].to_numpy(dtype='float64')
+        self.scaler.partial_fit(X)
+        self.model.partial_fit(self.scaler.transform(X), y)
+
+        self.batches_seen += 1
+        self.rows_seen += len(y)
+        if self.checkpoint_path and self.batches_seen % self.checkpoint_every == 0:
+            self.save(self.checkpoint_path)
+        return len(y)
+
+    def fit_chunks(self, chunks):
+        """Warm start from historical feature chunks, one partial_fit per chunk"""
+        for chunk in chunks:
+            self.partial_fit(chunk)
+        return self
+
+    def predict(self, X):
+        """Predict from a feature frame (or array) in feature column order"""
+        X = X[self.feature_cols].to_numpy(dtype='float64') if hasattr(X, 'columns') else np.asarray(X, dtype='float64')
+        return self.model.predict(self.scaler.transform(X))
+
+    def save(self, path):
+        """Checkpoint the scaler, model and counters"""
+        tmp_path = path + '.tmp'
+        joblib.dump({
+            'feature_cols': self.feature_cols,
+            'scaler': self.scaler,
+            'model': self.model,
+            'batches_seen': self.batches_seen,
+            'rows_seen': self.rows_seen
+        }, tmp_path)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path, checkpoint_every=DEFAULT_CHECKPOINT_EVERY):
+        """Restore a forecaster from a checkpoint written by save()"""
+        state = joblib.load(path)
+        forecaster = cls(feature_cols=state['feature_cols'], checkpoint_path=path,
+                         checkpoint_every=checkpoint_every)
+        forecaster.scaler = state['scaler']
+        forecaster.model = state['model']
+        forecaster.batches_seen = state['batches_seen']
+        forecaster.rows_seen = state['rows_seen']
+        return forecaster
@@ -0,0 +1,110 @@
+import os
+import time
+import shutil
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import pandas as pd
+from sklearn.ensemble import RandomForestRegressor
+from sklearn.cluster import KMeans
+from sklearn.metrics import mean_absolute_error
+
+from models.hyperparameter_search import time_ordered_holdout
+
+MIN_GROUP_ROWS = 100
+
+
+def _collect(chunks, feature_cols):
+    """Stack complete feature rows with a time-ordered holdout flag and hourly profiles per meter"""
+    X_parts, y_parts, meter_parts, holdout_parts, profiles = [], [], [], [], []
+    for chunk in chunks:
+        complete = chunk[feature_cols].notna().all(axis=1) & chunk['t_kWh'].notna()
+        chunk = chunk[complete]
+        meters = chunk['meter'].astype(str).to_numpy()
+        # Chunks hold whole meters sorted by time, so the holdout can be flagged per chunk
+        holdout_parts.append(time_ordered_holdout(meters))
+
+        X_parts.append(chunk[feature_cols].to_numpy(dtype='float32'))
+        y_parts.append(chunk['t_kWh'].to_numpy(dtype='float32'))
+        meter_parts.append(meters)
+        profiles.append(chunk['t_kWh'].groupby([meters, chunk.index.hour]).mean().unstack())
+
+    profile = pd.concat(profiles).reindex(columns=range(24)) if profiles else pd.DataFrame(columns=range(24))
+    return (np.concatenate(X_parts), np.concatenate(y_parts), np.concatenate(meter_parts),
+            np.concatenate(holdout_parts), profile)
+
+
+def cluster_meters(profile, n_clusters, random_state=42):
+    """Group meters with similar average daily load shapes"""
+    values = profile.fillna(profile.mean()).fillna(0).to_numpy()
+    n_clusters = min(n_clusters, len(values))
+    labels = KMeans(n_clusters=n_clusters, n_init=10, random_state=random_state).fit_predict(values)
+    return {meter: f'cluster-{label}' for meter, label in zip(profile.index, labels)}
+
+
+def _fit_group(paths, start, end, params):
+    """Worker: fit one group's forest on its slice of the memory-mapped arrays"""
+    began = time.perf_counter()
+    X = np.load(paths['X'], mmap_mode='r')[start:end]
+    y = np.load(paths['y'], mmap_mode='r')[start:end]
+    holdout = np.load(paths['holdout'], mmap_mode='r')[start:end]
+    train = ~holdout if (~holdout).sum() >= MIN_GROUP_ROWS else np.ones(len(y), dtype=bool)
+
+    model = RandomForestRegressor(**params, n_jobs=1)
+    model.fit(X[train], y[train])
+    mae = None
+    if holdout.any() and not train.all():
+        mae = float(mean_absolute_error(y[holdout], model.predict(X[holdout])))
+    return model, mae, time.perf_counter() - began
+
+
+def train_registry(chunks, feature_cols, params, mode='meter', n_clusters=8, workers=None):
+    """Fit one forecaster per meter or per meter cluster across a process pool
+
+    Feature rows are written once to .npy files, sorted by group, and each
+    worker memory-maps only its own slice. Groups with too few rows fall back
+    to the global model. Returns the registry dict MLModels routes through.
+    """
+    workers = workers or os.cpu_count() or 1
+    X, y, meters, holdout, profile = _collect(chunks, feature_cols)
+    if mode == 'cluster':
+        meter_groups = cluster_meters(profile, n_clusters)
+    else:
+        meter_groups = {meter: meter for meter in profile.index}
+
+    groups = np.array([meter_groups[meter] for meter in meters])
+    order = np.argsort(groups, kind='stable')
+    labels, starts, counts = np.unique(groups[order], return_index=True, return_counts=True)
+
+    tmp_dir = tempfile.mkdtemp(prefix='meter_training_')
+    paths = {name: os.path.join(tmp_dir, name + '.npy') for name in ['X', 'y', 'holdout']}
+    try:
+        np.save(paths['X'], X[order])
+        np.save(paths['y'], y[order])
+        np.save(paths['holdout'], holdout[order])
+        del X, y, holdout
+
+        print(f"Training {len(labels)} {mode} models with {workers} workers...")
+        began = time.perf_counter()
+        models, mae, fit_seconds = {}, {}, {}
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            futures = {}
+            for label, start, count in zip(labels, starts, counts):
+                if count < MIN_GROUP_ROWS:
+                    continue
+                futures[str(label)] = pool.submit(_fit_group, paths, int(start), int(start + count), params)
+            for label, future in futures.items():
+                models[label], mae[label], fit_seconds[label] = future.result()
+        elapsed = time.perf_counter() - began
+    finally:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+
+    print(f"Trained {len(models)} models in {elapsed:.1f}s "
+          f"({sum(fit_seconds.values()):.1f}s of fitting across workers)")
+    return {
+        'mode': mode,
+        'models': models,
+        'meter_groups': {meter: group for meter, group in meter_groups.items() if group in models},
+        'mae': mae,
+        'fit_seconds': fit_seconds
+    }
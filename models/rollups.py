@@ -0,0 +1,282 @@
+import threading
+from collections import OrderedDict
+import numpy as np
+import pandas as pd
+
+SUM_COLUMNS = ['t_kWh', 'carbon_emissions']
+MEAN_COLUMNS = ['z_Avg Voltage (Volt)', 'z_Avg Current (Amp)', 'y_Freq (Hz)']
+
+# Pyramid levels from finest to coarsest. Fixed-width levels map to a floor
+# frequency; calendar levels map to the period their buckets are (weeks start
+# on Monday, i.e. end on Sunday)
+RESOLUTIONS = OrderedDict([
+    ('15min', '15min'),
+    ('hourly', 'h'),
+    ('daily', 'D'),
+    ('weekly', 'W-SUN'),
+    ('monthly', 'M')
+])
+CALENDAR_LEVELS = ['weekly', 'monthly']
+
+# Fixed bucket widths; weekly and monthly are calendar-anchored instead
+FIXED_WIDTHS = OrderedDict([
+    ('15min', pd.Timedelta('15min')),
+    ('hourly', pd.Timedelta('1h')),
+    ('daily', pd.Timedelta('1D'))
+])
+
+# Levels whose buckets nest exactly inside each level's buckets
+BUILT_FROM = {
+    '15min': [],
+    'hourly': ['15min'],
+    'daily': ['15min', 'hourly'],
+    'weekly': ['15min', 'hourly', 'daily'],
+    'monthly': ['15min', 'hourly', 'daily']
+}
+
+
+def bucket_start(timestamps, resolution):
+    """Start of the bucket each timestamp falls into, for a pyramid level or fixed frequency"""
+    timestamps = pd.DatetimeIndex(timestamps)
+    if resolution in CALENDAR_LEVELS:
+        return timestamps.to_period(RESOLUTIONS[resolution]).start_time
+    return timestamps.floor(RESOLUTIONS.get(resolution, resolution))
+
+
+def _agg_spec(columns):
+    """How each additive column combines when buckets are merged"""
+    spec = {}
+    for col in columns:
+        if col.endswith('__min'):
+            spec[col] = 'min'
+        elif col.endswith('__max'):
+            spec[col] = 'max'
+        else:
+            spec[col] = 'sum'
+    return spec
+
+
+def partial_rollup(df, resolution):
+    """Additive (sum, count, min, max) aggregates per meter and time bucket"""
+    value_cols = [col for col in SUM_COLUMNS + MEAN_COLUMNS if col in df.columns]
+    keys = [bucket_start(df.index, resolution).rename('x_Timestamp')]
+    if 'meter' in df.columns:
+        keys.insert(0, df['meter'])
+    grouped = df[value_cols].astype('float64').groupby(keys, observed=True)
+    parts = [
+        grouped.sum(),
+        grouped.count().add_suffix('__count'),
+        grouped.min().add_suffix('__min'),
+        grouped.max().add_suffix('__max')
+    ]
+    if 'is_filled' in df.columns:
+        # Gap mask: how many readings in each bucket were imputed by the fill
+        filled = df['is_filled'].astype('int64').groupby(keys, observed=True).sum()
+        parts.append(filled.rename('filled_readings'))
+    return pd.concat(parts, axis=1)
+
+
+def combine_partials(partials):
+    """Merge partial aggregates that may share buckets"""
+    combined = pd.concat(partials)
+    levels = list(range(combined.index.nlevels))
+    return combined.groupby(level=levels, observed=True).agg(_agg_spec(combined.columns))
+
+
+def regroup_partial(partial, resolution):
+    """Roll partial aggregates up to a coarser pyramid level or fixed frequency"""
+    timestamps = bucket_start(partial.index.get_level_values('x_Timestamp'), resolution)
+    keys = [timestamps.rename('x_Timestamp')]
+    if partial.index.nlevels > 1:
+        keys.insert(0, partial.index.get_level_values('meter'))
+    return partial.groupby(keys, observed=True).agg(_agg_spec(partial.columns))
+
+
+def merge_partial(partial, batch_partial):
+    """Add a batch's aggregates into an existing rollup, appending only new cells"""
+    batch_partial = batch_partial.reindex(columns=partial.columns)
+    spec = _agg_spec(partial.columns)
+    sum_cols = [col for col, how in spec.items() if how == 'sum']
+    batch_partial[sum_cols] = batch_partial[sum_cols].fillna(0)
+    existing = batch_partial.index.isin(partial.index)
+    if existing.any():
+        cells = batch_partial.index[existing]
+        current = partial.loc[cells]
+        incoming = batch_partial[existing]
+        merged = current.copy()
+        for col, how in spec.items():
+            if how == 'min':
+                merged[col] = np.fmin(current[col].values, incoming[col].values)
+            elif how == 'max':
+                merged[col] = np.fmax(current[col].values, incoming[col].values)
+            else:
+                merged[col] = current[col].values + incoming[col].values
+        partial.loc[cells] = merged.values
+    if not existing.all():
+        partial = pd.concat([partial, batch_partial[~existing]])
+    return partial
+
+
+def finalize_rollup(partial):
+    """Turn additive aggregates into the hourly/daily frame layout"""
+    result = pd.DataFrame(index=partial.index)
+    for col in SUM_COLUMNS:
+        if col in partial.columns:
+            result[col] = partial[col]
+    for col in MEAN_COLUMNS:
+        if col in partial.columns:
+            result[col] = partial[col] / partial[col + '__count'].replace(0, np.nan)
+    if 'filled_readings' in partial.columns:
+        result['filled_readings'] = partial['filled_readings'].astype('int64')
+    return result.reset_index()
+
+
+def rollup_stats(partial, column):
+    """sum/mean/min/max/count of one column for every bucket of a partial"""
+    count = partial[column + '__count']
+    stats = pd.DataFrame({
+        'sum': partial[column],
+        'mean': partial[column] / count.replace(0, np.nan),
+        'min': partial[column + '__min'],
+        'max': partial[column + '__max'],
+        'count': count.astype('int64')
+    }, index=partial.index)
+    return stats.reset_index()
+
+
+def _is_aligned(timestamp, resolution):
+    timestamp = pd.Timestamp(timestamp)
+    return bucket_start([timestamp], resolution)[0] == timestamp
+
+
+class LazyRollups:
+    """Rollup pyramid whose levels are computed on first access and released under memory pressure"""
+
+    def __init__(self, source, budget_mb=None):
+        self._source = source
+        self.budget_mb = budget_mb
+        self._partials = OrderedDict()
+        self._views = {}
+        self._lock = threading.RLock()
+
+    def get(self, resolution):
+        """Finalized rollup frame for a resolution, computing it if needed"""
+        with self._lock:
+            if resolution not in self._views:
+                partial = self._partial(resolution)
+                self._views[resolution] = finalize_rollup(partial)
+                self._enforce_budget(keep=resolution)
+            self._partials.move_to_end(resolution)
+            return self._views[resolution]
+
+    def level(self, resolution):
+        """Additive aggregates of one pyramid level"""
+        with self._lock:
+            partial = self._partial(resolution)
+            self._partials.move_to_end(resolution)
+            self._enforce_budget(keep=resolution)
+            return partial
+
+    def _partial(self, resolution):
+        if resolution not in RESOLUTIONS:
+            raise KeyError(f"Unknown rollup resolution: {resolution}")
+        if resolution in self._partials:
+            return self._partials[resolution]
+
+        # Reuse the coarsest finer level already in memory instead of rescanning raw rows
+        finer = [name for name in BUILT_FROM[resolution] if name in self._partials]
+        if finer:
+            partial = regroup_partial(self._partials[finer[-1]], resolution)
+        else:
+            print(f"Computing {resolution} rollup...")
+            partial = partial_rollup(self._source(), resolution)
+        self._partials[resolution] = partial
+        return partial
+
+    def seed(self, resolution, partial):
+        """Install an already computed rollup, e.g. from the streaming loader"""
+        with self._lock:
+            self._partials[resolution] = partial
+            self._views.pop(resolution, None)
+
+    def merge(self, batch):
+        """Fold new raw rows into every materialized resolution, touching only their cells"""
+        with self._lock:
+            for resolution in list(self._partials):
+                batch_partial = partial_rollup(batch, resolution)
+                self._partials[resolution] = merge_partial(self._partials[resolution], batch_partial)
+                self._views.pop(resolution, None)
+
+    def plan(self, granularity='daily', start=None, end=None):
+        """Coarsest level whose buckets nest in the granularity and align with the range
+
+        `granularity` is a level name or a fixed frequency such as '6h'; `end` is
+        exclusive. Returns None when even the finest level does not fit.
+        """
+        if granularity in RESOLUTIONS:
+            candidates = [granularity] + BUILT_FROM[granularity][::-1]
+        else:
+            width = pd.Timedelta(granularity)
+            candidates = [name for name, step in reversed(FIXED_WIDTHS.items())
+                          if width % step == pd.Timedelta(0)]
+        for name in candidates:
+            if start is not None and not _is_aligned(start, name):
+                continue
+            if end is not None and not _is_aligned(end, name):
+                continue
+            return name
+        return None
+
+    def query(self, column='t_kWh', granularity='daily', start=None, end=None, meters=None):
+        """Per-meter sum/mean/min/max/count of a column, served from the best pyramid level"""
+        level = self.plan(granularity, start, end)
+        if level is not None:
+            partial = self.level(level)
+            timestamps = partial.index.get_level_values('x_Timestamp')
+            meter_values = partial.index.get_level_values('meter') if partial.index.nlevels > 1 else None
+        else:
+            # Range not aligned to any level: aggregate the raw rows directly
+            partial = self._source()
+            timestamps = partial.index
+            meter_values = partial['meter'] if 'meter' in partial.columns else None
+
+        mask = np.ones(len(partial), dtype=bool)
+        if start is not None:
+            mask &= timestamps >= pd.Timestamp(start)
+        if end is not None:
+            mask &= timestamps < pd.Timestamp(end)
+        if meters is not None and meter_values is not None:
+            mask &= np.asarray(meter_values.isin(meters))
+        partial = partial[mask]
+
+        if level is None:
+            partial = partial_rollup(partial, granularity)
+        elif level != granularity:
+            partial = regroup_partial(partial, granularity)
+        return rollup_stats(partial, column)
+
+    def is_materialized(self, resolution):
+        return resolution in self._partials
+
+    def release(self, resolution=None):
+        """Drop one resolution, or all of them, until next accessed"""
+        with self._lock:
+            names = [resolution] if resolution is not None else list(self._partials)
+            for name in names:
+                self._partials.pop(name, None)
+                self._views.pop(name, None)
+
+    def memory_usage_mb(self):
+        frames = list(self._partials.values()) + list(self._views.values())
+        return sum(frame.memory_usage(deep=True).sum() for frame in frames) / 1024 ** 2
+
+    def _enforce_budget(self, keep):
+        """Release least recently used resolutions while over the memory budget"""
+        if self.budget_mb is None:
+            return
+        for name in list(self._partials):
+            if self.memory_usage_mb() <= self.budget_mb:
+                break
+            if name != keep:
+                print(f"Releasing {name} rollup (memory budget)")
+                self.release(name)
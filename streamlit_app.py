@@ -1,5 +1,5 @@
-import streamlit as st
 import sqlite3
+import streamlit as st
 import pandas as pd
 import numpy as np
 from datetime import datetime, timedelta
@@ -9,6 +9,9 @@ from werkzeug.security import generate_password_hash, check_password_hash
 from models.data_processor import DataProcessor
 from models.ml_models import MLModels
 from models.gamification import GamificationEngine
+from models.badges import classify_consumption
+from models.db import get_connection, transaction
+from models.migrations import migrate
 
 # Page config
 st.set_page_config(
@@ -275,52 +278,43 @@ h1, h2, h3 {
 # Initialize components
 @st.cache_resource
 def init_components():
-    data_processor = DataProcessor()
+    data_processor = DataProcessor(use_cache=True)
     ml_models = MLModels()
+    feature_store = data_processor.get_feature_store()
+    ml_models.ensure_trained(data_processor.df, feature_store=feature_store)
+    if feature_store is not None:
+        ml_models.forecast_fleet(feature_store.latest())
+    else:
+        ml_models.forecast_fleet(data_processor.hourly_data)
     gamification = GamificationEngine()
     return data_processor, ml_models, gamification
 
 def init_db():
-    conn = sqlite3.connect('energy_app.db')
-    cursor = conn.cursor()
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS users (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            username TEXT UNIQUE NOT NULL,
-            email TEXT UNIQUE NOT NULL,
-            password_hash TEXT NOT NULL,
-            meter_id TEXT,
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-        )
-    ''')
-    conn.commit()
-    conn.close()
+    migrate()
 
 def authenticate_user(username, password):
-    conn = sqlite3.connect('energy_app.db')
+    conn = get_connection()
     cursor = conn.cursor()
     cursor.execute('SELECT * FROM users WHERE username = ?', (username,))
     user_data = cursor.fetchone()
-    conn.close()
     
     if user_data and check_password_hash(user_data[3], password):
         return {"id": user_data[0], "username": user_data[1], "email": user_data[2], "meter_id": user_data[4]}
     return None
 
 def register_user(username, email, password, meter_id):
-    conn = sqlite3.connect('energy_app.db')
-    cursor = conn.cursor()
-    
-    cursor.execute('SELECT * FROM users WHERE username = ? OR email = ?', (username, email))
-    if cursor.fetchone():
-        conn.close()
-        return False
-    
     password_hash = generate_password_hash(password)
-    cursor.execute('INSERT INTO users (username, email, password_hash, meter_id) VALUES (?, ?, ?, ?)',
-                  (username, email, password_hash, meter_id))
-    conn.commit()
-    conn.close()
+    try:
+        with transaction() as conn:
+            cursor = conn.cursor()
+            cursor.execute('SELECT * FROM users WHERE username = ? OR email = ?', (username, email))
+            if cursor.fetchone():
+                return False
+            cursor.execute('INSERT INTO users (username, email, password_hash, meter_id) VALUES (?, ?, ?, ?)',
+                          (username, email, password_hash, meter_id))
+    except sqlite3.IntegrityError:
+        # Another session registered the same username or email first
+        return False
     return True
 
 def login_page():
@@ -509,12 +503,20 @@ def show_dashboard(data_processor, ml_models, gamification, user):
     st.subheader("🔮 7-Day Forecast")
     forecast_data = ml_models.get_forecast(user['meter_id'])
     if forecast_data:
-        df_forecast = pd.DataFrame(forecast_data)
+        # Quantiles are None when the model gives no band, e.g. placeholder forecasts
+        df_forecast = pd.DataFrame({key: values for key, values in forecast_data.items() if values is not None})
         # Use correct column names from forecast_data
         x_col = 'dates' if 'dates' in df_forecast.columns else 'date'
         y_col = 'forecast' if 'forecast' in df_forecast.columns else 'predicted_consumption'
         fig = px.line(df_forecast, x=x_col, y=y_col, title='Energy Consumption Forecast')
         fig.update_traces(line=dict(color='#28a745', dash='dash'))
+        if 'lower' in df_forecast.columns and 'upper' in df_forecast.columns:
+            # P10-P90 band from the forest's per-tree forecasts
+            fig.add_trace(go.Scatter(x=df_forecast[x_col], y=df_forecast['upper'], mode='lines',
+                                     line=dict(width=0), showlegend=False, hoverinfo='skip'))
+            fig.add_trace(go.Scatter(x=df_forecast[x_col], y=df_forecast['lower'], mode='lines',
+                                     line=dict(width=0), fill='tonexty', fillcolor='rgba(40, 167, 69, 0.2)',
+                                     name='P10-P90 range'))
         st.plotly_chart(fig, use_container_width=True)
     else:
         st.info("No forecast data available")
@@ -763,17 +765,8 @@ def show_leaderboard(gamification, user):
         df = pd.DataFrame(rankings)
         
         # Add badge column
-        def get_badge_emoji(consumption):
-            if consumption < 2:
-                return "🌱 Eco Saver"
-            elif consumption < 5:
-                return "🌍 Green User"
-            elif consumption < 8:
-                return "🔥 Carbon Heavy"
-            else:
-                return "🏆 Efficient Hero"
-        
-        df['Badge'] = df['avg_consumption'].apply(get_badge_emoji)
+        badge_labels = {badge_type: f"{badge['emoji']} {badge['name']}" for badge_type, badge in gamification.badges.items()}
+        df['Badge'] = [badge_labels[badge_type] for badge_type in classify_consumption(df['avg_consumption'])]
         df['Rank'] = df.index + 1
         
         # Display with styling
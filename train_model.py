@@ -4,10 +4,80 @@
 Train ML models and display accuracy metrics
 """
 
+import argparse
+
 from models.data_processor import DataProcessor
 from models.ml_models import MLModels
 
+def parse_args():
+    parser = argparse.ArgumentParser(description="Train the forecasting and badge models")
+    parser.add_argument('--per-meter', action='store_true',
+                        help="also train one forecaster per meter in worker processes")
+    parser.add_argument('--clusters', type=int, default=None,
+                        help="train one forecaster per cluster of similar meters instead")
+    parser.add_argument('--workers', type=int, default=None,
+                        help="worker processes for per-meter training, backtests and search (default: all cores)")
+    parser.add_argument('--backtest', action='store_true',
+                        help="run a rolling-origin backtest instead of training")
+    parser.add_argument('--folds', type=int, default=3, help="backtest folds per meter")
+    parser.add_argument('--horizon', type=int, default=24, help="backtest forecast horizon in hours")
+    parser.add_argument('--window', type=int, default=None,
+                        help="rolling training window in hours (default: expanding window)")
+    parser.add_argument('--search', action='store_true',
+                        help="run a successive-halving hyperparameter search instead of training")
+    parser.add_argument('--time-budget', type=float, default=600, help="search wall-clock budget in seconds")
+    parser.add_argument('--memory-budget-mb', type=float, default=1024,
+                        help="memory for all concurrent search fits together, in MB")
+    parser.add_argument('--max-model-mb', type=float, default=256,
+                        help="largest flattened model to keep, in MB")
+    parser.add_argument('--max-latency-ms', type=float, default=None,
+                        help="drop models slower than this for one prediction")
+    return parser.parse_args()
+
+def run_backtest(data_processor, ml_models, args):
+    print(f"Backtesting {args.folds} folds x {args.horizon}h per meter...")
+    report = ml_models.backtest(data_processor.df, folds=args.folds, horizon=args.horizon,
+                                window=args.window, workers=args.workers)
+    horizon, folds = report['horizon'], report['folds']
+    if folds.empty:
+        print("Not enough history for any backtest fold")
+        return
+    
+    print("\n=== BACKTEST RESULTS ===")
+    print(f"Folds: {len(folds)} across {folds['meter'].nunique()} meters")
+    print(f"Overall MAE: {folds['mae'].mean():.4f} kWh")
+    print("Per-horizon error:")
+    for row in horizon.itertuples():
+        print(f"   +{row.horizon:>3}h  MAE {row.mae:.4f} kWh  MAPE {row.mape:.2f}%")
+    print(f"Mean fit time: {folds['fit_seconds'].mean():.3f}s, "
+          f"mean predict time: {folds['predict_seconds'].mean():.3f}s per fold")
+    print("========================\n")
+
+def run_search(data_processor, ml_models, args):
+    report = ml_models.search_hyperparameters(data_processor.df, time_budget_s=args.time_budget,
+                                              memory_budget_mb=args.memory_budget_mb,
+                                              max_model_mb=args.max_model_mb,
+                                              max_latency_ms=args.max_latency_ms, workers=args.workers)
+    if report is None:
+        print("Not enough data for a hyperparameter search")
+        return
+    
+    for kind, metric in [('forecast', 'MAE'), ('badge', 'Accuracy')]:
+        result = report[kind]
+        print(f"\n=== {kind.upper()} MODEL SEARCH ===")
+        print(f"Candidates evaluated: {len(result['results'])}")
+        if result['best'] is None:
+            print("No candidate fit the budgets")
+            continue
+        print("Accuracy vs latency (Pareto front):")
+        for row in result['front'].itertuples():
+            print(f"   n_estimators={row.n_estimators}, max_depth={row.max_depth}, "
+                  f"max_features={row.max_features}: {metric} {row.score:.4f}, "
+                  f"{row.latency_ms:.3f} ms, {row.model_mb:.1f} MB")
+        print(f"Best within budget: {result['best']}")
+
 def main():
+    args = parse_args()
     print("Starting model training...")
     
     # Initialize components
@@ -21,6 +91,14 @@ def main():
     
     print(f"Dataset shape: {data_processor.df.shape}")
     
+    if args.backtest:
+        run_backtest(data_processor, ml_models, args)
+        return
+    
+    if args.search:
+        run_search(data_processor, ml_models, args)
+        return
+    
     # Train models
     success = ml_models.train_models(data_processor.df)
     
@@ -35,6 +113,19 @@ def main():
         
     else:
         print("Model training failed")
+        return
+    
+    if args.per_meter or args.clusters:
+        mode = 'cluster' if args.clusters else 'meter'
+        if ml_models.train_meter_models(data_processor.df, mode=mode, n_clusters=args.clusters or 8,
+                                        workers=args.workers):
+            registry = ml_models.registry
+            print(f"\nPer-{mode} models: {len(registry['models'])}")
+            for group, mae in sorted(registry['mae'].items()):
+                mae_text = f"{mae:.4f} kWh" if mae is not None else "n/a"
+                print(f"   {group}: MAE {mae_text}, fit {registry['fit_seconds'][group]:.2f}s")
+        else:
+            print("Per-meter training failed")
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()